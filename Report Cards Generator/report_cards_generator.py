@@ -11,91 +11,418 @@ email: erickmwenda256@gmail.com
 phone: +254 702 623 729 / +254 799 678 038
 '''
 
+import io
+import csv
+import json
+import hashlib
+import importlib.util
+import sys
+import copy
+import os
 import re
+import shutil
+import tempfile
 import docx
 import time
+import cProfile
+import argparse
+import textwrap
+from array import array
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
 from docx.enum.section import WD_ORIENT
 from docx.shared import Pt, Cm, Mm, RGBColor, Inches
 from docx.enum.text import WD_UNDERLINE
 
-import matplotlib.pyplot as plt
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
  
 
-opener_exams = [[['127'], [(52, 'B-', 8), (36, 'C-', 5), (60, 'B+', 10), (22, 'D', 3), (55, 'B', 9), (86, 'A', 12), (35, 'C-', 5), (66, 'A-', 11), (88, 'A', 12), (14, 'E', 1), (76, 'A', 12), (36, 'C-', 5)], [52, 'B-']], [['130'], [(33, 'D+', 4), (29, 'D', 3), (77, 'A', 12), (22, 'D', 3), (69, 'A-', 11), (58, 'B', 9), (47, 'C+', 7), (88, 'A', 12), (89, 'A', 12), (77, 'A', 12), (80, 'A', 12), (63, 'B+', 10)], [61, 'B+']], [['225'], [(12, 'E', 1), (36, 'C-', 5), (25, 'D', 3), (14, 'E', 1), (52, 'B-', 8), (47, 'C+', 7), (22, 'D', 3), (58, 'B', 9), (32, 'D+', 4), (55, 'B', 9), (41, 'C', 6), (42, 'C', 6)], [36, 'C-']], [['290'], [(-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0)], ['', '']]]
-midterm_exams = [[['127'], [(25, 'D', 3), (52, 'B-', 8), (5, 'E', 1), (96, 'A', 12), (55, 'B', 9), (96, 'A', 12), (44, 'C', 6), (52, 'B-', 8), (85, 'A', 12), (88, 'A', 12), (96, 'A', 12), (14, 'E', 1)], [59, 'B']], [['130'], [(25, 'D', 3), (11, 'E', 1), (9, 'E', 1), (25, 'D', 3), (96, 'A', 12), (77, 'A', 12), (25, 'D', 3), (69, 'A-', 11), (47, 'C+', 7), (85, 'A', 12), (90, 'A', 12), (58, 'B', 9)], [51, 'B-']], [['225'], [(22, 'D', 3), (85, 'A', 12), (22, 'D', 3), (74, 'A', 12), (22, 'D', 3), (36, 'C-', 5), (84, 'A', 12), (36, 'C-', 5), (96, 'A', 12), (47, 'C+', 7), (85, 'A', 12), (72, 'A', 12)], [56, 'B']], [['290'], [(-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0), (-1, '', 0)], ['', '']]]
-endterm_exams = [[['127'], [(12, 'E', 1), (55, 'B', 9), (96, 'A', 12), (48, 'C+', 7), (55, 'B', 9), (80, 'A', 12), (12, 'E', 1), (55, 'B', 9), (36, 'C-', 5), (88, 'A', 12), (69, 'A-', 11), (30, 'D+', 4)], [53, 'B-']], [['130'], [(11, 'E', 1), (85, 'A', 12), (14, 'E', 1), (36, 'C-', 5), (66, 'A-', 11), (45, 'C+', 7), (36, 'C-', 5), (77, 'A', 12), (36, 'C-', 5), (65, 'A-', 11), (77, 'A', 12), (12, 'E', 1)], [46, 'C+']], [['225'], [(15, 'D-', 2), (88, 'A', 12), (63, 'B+', 10), (85, 'A', 12), (44, 'C', 6), (78, 'A', 12), (42, 'C', 6), (36, 'C-', 5), (85, 'A', 12), (44, 'C', 6), (36, 'C-', 5), (59, 'B', 9)], [56, 'B']], [['290'], [(25, 'D', 3), (36, 'C-', 5), (11, 'E', 1), (85, 'A', 12), (-1, '', 0), (80, 'A', 12), (36, 'C-', 5), (-1, '', 0), (85, 'A', 12), (-1, '', 0), (70, 'A', 12), (-1, '', 0)], [53, 'B-']]]
+EXAM_NAMES = ["Opener", "Midterm", "Endterm"]
+
+CLASS_TEACHER_COMMENT = "Your progress is amazing. I have no doubt that next time you will soar as high as an eagle. Keep up the good work and never give up."
+HEAD_TEACHER_COMMENT = "You are a reader. Keep up your good work and never give up. Success is fo those who study well."
+SCHOOL_CLOSING_DATE = "Monday 01 August, 2024"
+SCHOOL_OPENING_DATE = "Wednesday 27 August, 2024"
+
+# Bump whenever the card layout or graph drawing changes, so cached
+# cards and graphs from older runs are not reused
+TEMPLATE_VERSION = 2
+
+# Subjects on the report card in the order their marks appear in the exam
+# data: (code, subject, remarks, teacher)
+
+SUBJECTS = [
+    (100, "ENGLISH", "Good", "Ondari"),
+    (101, "KISWAHILI", "Good", "Polly"),
+    (202, "MATHEMATICS", "Very Good", "Partrick"),
+    (123, "BIOLOGY", "Good", "Charles"),
+    (342, "PHYSICS", "Excellent", "Wycliffe"),
+    (333, "CHEMISTRY", "Good", "Wycliffe"),
+    (331, "HISTORY", "Good", "Sandra"),
+    (165, "GEOGRAPHY", "Good", "Miriam"),
+    (112, "CRE", "Poor", "Doris"),
+    (213, "AGRICULTURE", "Good", "Charles"),
+    (445, "COMPUTER", "Good", "Erick"),
+    (559, "BUSINESS", "Exellent", "Jackline"),
+]
+
+GRADING_SYSTEM = {'_id': 'DB_GRD_001', 'SCIENCE': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'LANGUAGES': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'HUMANITIES': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'GENERAL': {'E': [[7, 10], 1, 'POOR'], 'D-': [[11, 17], 2, 'WEAK'], 'D': [[18, 24], 3, 'WEAK'], 'D+': [[25, 31], 4, 'WEAK'], 'C-': [[32, 38], 5, 'AVERAGE'], 'C': [[39, 45], 6, 'AVERAGE'], 'C+': [[46, 52], 7, 'AVERAGE'], 'B-': [[53, 59], 8, 'GOOD'], 'B': [[60, 66], 9, 'GOOD'], 'B+': [[67, 73], 10, 'GOOD'], 'A-': [[74, 80], 11, 'VERY GOOD'], 'A': [[81, 84], 12, 'VERY GOOD']}}
+
+# Grading table used for each subject, anything not listed is graded
+# with the GradingSystem's default group
+
+SUBJECT_GROUPS = {
+    "ENGLISH": "LANGUAGES",
+    "KISWAHILI": "LANGUAGES",
+    "MATHEMATICS": "SCIENCE",
+    "BIOLOGY": "SCIENCE",
+    "PHYSICS": "SCIENCE",
+    "CHEMISTRY": "SCIENCE",
+    "HISTORY": "HUMANITIES",
+    "GEOGRAPHY": "HUMANITIES",
+    "CRE": "HUMANITIES",
+}
   
-def process_exam_data(exam1, exam2, exam3):
-    final_data = {}
+### GRADING ###
 
-    collection_data = list(zip(exam1, exam2, exam3))
+class GradingSystem:
+    """
+    The grading band tables compiled once into lookup arrays indexed by
+    mark (or points, for GENERAL), so a whole array of marks is graded
+    with a single indexing operation. Each subject is graded with the
+    table of its group in subject_groups, or default_group, which is also
+    used for the mean marks.
+    """
     
-    for x,y,z in collection_data:
-        adm = list(zip(x[0],y[0],z[0]))[0][0]
-        marks_data = list(zip(x[1],y[1],z[1]))
-        results_data = list(zip(x[2],y[2],z[2]))
+    def __init__(self, tables=GRADING_SYSTEM, subject_groups=SUBJECT_GROUPS, default_group="SCIENCE"):
+        self.groups = [group for group, bands in tables.items() if isinstance(bands, dict)]
+        self.subject_groups = subject_groups
+        self.default_group = default_group
+        
+        compiled = [self._compile(tables[group]) for group in self.groups]
+        width = max(len(lookup) for lookup, _, _ in compiled)
+        bands = max(len(labels) for _, labels, _ in compiled)
+        label_length = max(len(label) for _, labels, _ in compiled for label in labels)
+        
+        # One row per group. The lookup gives the band of every value, -1
+        # outside the table, and band -1 is always the empty last column
+        self.lookup = np.full((len(self.groups), width), -1, dtype=np.int16)
+        self.labels = np.full((len(self.groups), bands + 1), "", dtype=f"<U{label_length}")
+        self.points = np.zeros((len(self.groups), bands + 1), dtype=np.int16)
+        
+        for row, (lookup, labels, points) in enumerate(compiled):
+            self.lookup[row, :len(lookup)] = lookup
+            self.labels[row, :len(labels)] = labels
+            self.points[row, :len(points)] = points
+            
+    @staticmethod
+    def _compile(bands):
+        ordered = sorted(bands.items(), key=lambda band: band[1][0][0])
+        lookup = np.full(max(band[0][1] for _, band in ordered) + 1, -1, dtype=np.int16)
+        
+        for index, (_, band) in enumerate(ordered):
+            low, high = band[0]
+            lookup[low:high + 1] = index
+            
+        return lookup, [grade for grade, _ in ordered], [band[1] for _, band in ordered]
+        
+    def group_index(self, group=None):
+        """Row of a group's table, the default group if none is given"""
+        return self.groups.index(group or self.default_group)
+        
+    def subject_group_indexes(self, subjects):
+        """Row of the grading table for each subject, as an array"""
+        return np.array([self.group_index(self.subject_groups.get(subject, self.default_group)) 
+                         for _, subject, _, _ in subjects])
+        
+    def grade(self, values, present, groups):
+        """
+        Grade an array of marks, each against the table of its group in
+        groups (group rows, broadcast against values). Returns arrays of
+        grades and points, with '' and 0 where present is False or the
+        value is outside the table.
+        """
+        values, groups = np.broadcast_arrays(np.asarray(values), np.asarray(groups))
         
-        final_data[adm] = [marks_data, results_data]
+        in_range = present & (values >= 0) & (values < self.lookup.shape[1])
+        index = np.where(in_range, self.lookup[groups, np.where(in_range, values, 0)], -1)
         
-    return final_data
+        return self.labels[groups, index], self.points[groups, index]
+        
+DEFAULT_GRADING = GradingSystem()
+        
+### MARKS ENGINE ###
+
+def _deviations(values, present):
+    """
+    Progress over the three exams on the last axis of values: the endterm
+    against the average of the first two, or the later exam against the
+    earlier one when only two were sat. Returns the deviations and a mask
+    of where a deviation could be worked out.
+    """
+    m1, m2, m3 = np.moveaxis(values.astype(np.float64), -1, 0)
+    p1, p2, p3 = np.moveaxis(present, -1, 0)
     
-def calcDeviation(marks1, marks2, marks3):
-    m1 = marks1[0] if marks1[0] != -1 else 0 
-    m2 = marks2[0] if marks2[0] != -1 else 0
-    m3 = marks3[0] if marks3[0] != -1 else 0 
+    conditions = [p1 & p2 & p3, p2 & p3, p1 & p3, p1 & p2]
+    choices = [np.trunc(m3 - (m1 + m2) / 2), m3 - m2, m3 - m1, m2 - m1]
     
-    deviation = "-"
+    deviations = np.select(conditions, choices, 0).astype(np.int32)
     
-    if m1 and m2 and m3:
-        deviation = int(m3 - (m1+m2)/2)
-        if deviation > 0:
-            deviation = f"+{deviation}"
+    return deviations, np.logical_or.reduce(conditions)
+    
+def rank_scores(scores, groups=None, method="competition"):
+    """
+    Position every score within its group, highest score first, using one
+    sort for all groups. Tied scores share a position: "competition"
+    ranking leaves a gap after a tie (1, 2, 2, 4) while "dense" ranking
+    does not (1, 2, 2, 3). NaN scores are left unranked at position 0.
+    Returns the positions and the number ranked in each score's group.
+    """
+    if method not in ("competition", "dense"):
+        raise ValueError(f"Unknown ranking method: {method}")
         
-    if (m2 and m3) and not m1:
-        deviation = m3 - m2
-        if deviation > 0:
-            deviation = f"+{deviation}"
-            
-    if (m1 and m3) and not m2:
-        deviation = m3 - m1
-        if deviation > 0:
-            deviation = f"+{deviation}"
+    scores = np.asarray(scores, dtype=np.float64)
+    groups = np.zeros(len(scores), dtype=np.intp) if groups is None else np.asarray(groups)
+    ranked = ~np.isnan(scores)
+    
+    # Sort by group, then ranked before unranked, then highest score first
+    order = np.lexsort((-scores, ~ranked, groups))
+    sorted_scores = scores[order]
+    sorted_groups = groups[order]
+    
+    index = np.arange(len(scores))
+    new_group = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    new_score = new_group | np.r_[True, sorted_scores[1:] != sorted_scores[:-1]]
+    
+    group_start = np.maximum.accumulate(np.where(new_group, index, 0))
+    
+    if method == "competition":
+        score_start = np.maximum.accumulate(np.where(new_score, index, 0))
+        sorted_positions = score_start - group_start + 1
+    else:
+        distinct = np.cumsum(new_score)
+        sorted_positions = distinct - distinct[group_start] + 1
+        
+    positions = np.empty(len(scores), dtype=np.int64)
+    positions[order] = sorted_positions
+    positions[~ranked] = 0
+    
+    _, group_codes = np.unique(groups, return_inverse=True)
+    out_of = np.bincount(group_codes, weights=ranked).astype(np.int64)[group_codes]
+    
+    return positions, out_of
+    
+class ClassMarks:
+    """
+    The marks of a whole class as a students x subjects x exams array,
+    with the deviations, means, grades and points on the report cards
+    worked out for every student at once. Missing marks are stored as -1
+    and are False in the present mask.
+    """
+    
+    def __init__(self, adms, marks, subjects=SUBJECTS, grading=None, streams=None):
+        self.adms = list(adms)
+        self.subjects = subjects
+        self.streams = list(streams) if streams is not None else [""] * len(self.adms)
+        self.marks = np.asarray(marks, dtype=np.int16)
+        
+        if self.marks.shape != (len(self.adms), len(subjects), len(EXAM_NAMES)):
+            raise ValueError(f"Expected marks for {len(self.adms)} students, {len(subjects)} subjects "
+                             f"and {len(EXAM_NAMES)} exams, got an array of shape {self.marks.shape}")
+        
+        grading = grading or DEFAULT_GRADING
+        subject_groups = grading.subject_group_indexes(subjects)
+        
+        self.present = self.marks >= 0
+        self.deviations, self.has_deviation = _deviations(self.marks, self.present)
+        self.grades, self.points = grading.grade(self.marks, self.present, subject_groups[:, None])
+        
+        # Mean of the subjects sat in each exam, students x exams
+        counts = self.present.sum(axis=1)
+        totals = np.where(self.present, self.marks, 0).sum(axis=1)
+        
+        self.has_mean = counts > 0
+        self.scores = np.where(self.has_mean, totals / np.maximum(counts, 1), np.nan)
+        self.means = np.where(self.has_mean, totals // np.maximum(counts, 1), 0)
+        self.mean_grades, self.mean_points = grading.grade(self.means, self.has_mean, grading.group_index())
+        self.mean_deviations, self.has_mean_deviation = _deviations(self.means, self.has_mean)
+        
+        self.rank()
+        
+    def rank(self, method="competition"):
+        """
+        Work out positions from the endterm: each student's position in the
+        class and in their stream by exact mean mark, and in each subject
+        by mark. Students who did not sit the endterm are not ranked.
+        """
+        scores = self.scores[:, -1]
+        
+        self.position, self.out_of = rank_scores(scores, method=method)
+        _, stream_codes = np.unique(self.streams, return_inverse=True)
+        self.stream_position, self.stream_out_of = rank_scores(scores, stream_codes, method)
+        
+        # All subjects ranked in the same single sort, grouped by subject
+        subject_marks = np.where(self.present[:, :, -1], self.marks[:, :, -1], np.nan)
+        subject_codes = np.broadcast_to(np.arange(len(self.subjects)), subject_marks.shape)
+        
+        position, out_of = rank_scores(subject_marks.ravel(), subject_codes.ravel(), method)
+        self.subject_position = position.reshape(subject_marks.shape)
+        self.subject_out_of = out_of.reshape(subject_marks.shape)
+        
+    def progress(self, student):
+        """The (means, grades) a student's progress graph is drawn from"""
+        means = np.where(self.has_mean[student], self.means[student], np.nan)
+        return means.tolist(), self.mean_grades[student].tolist()
+        
+### EXAM FILES ###
+
+def _read_exam_rows(path):
+    """Yield the rows of a CSV or XLSX exam file one at a time"""
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ["" if value is None else str(value) for value in row]
+        finally:
+            workbook.close()
             
-    if (m1 and m2) and not m3:
-        deviation = m2 - m1
-        if deviation > 0:
-            deviation = f"+{deviation}"
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as exam_file:
+            yield from csv.reader(exam_file)
             
-    return deviation
+def read_exam_file(path, subjects=SUBJECTS, grading=None):
+    """
+    Stream one exam's marks from a CSV or XLSX file. The first row is the
+    header: an ADM column, an optional STREAM column and a column per
+    subject named as in subjects. A "<SUBJECT> GRADE" column, if present,
+    is checked against the grading table. Empty cells are missing marks,
+    and marks must be whole numbers.
+    Returns the admission numbers, streams and an int16 students x
+    subjects array of marks.
+    """
+    grading = grading or DEFAULT_GRADING
     
-def calcDevSum(m1, m2, m3):
-    deviation = "-"
+    # Expected grade of every possible mark in every subject
+    groups = grading.subject_group_indexes(subjects)
+    expected_grades = grading.grade(np.arange(101), True, groups[:, None])[0].tolist()
     
-    m1 = int(m1) if isinstance(m1, int) else 0
-    m2 = int(m2) if isinstance(m2, int) else 0
-    m3 = int(m3) if isinstance(m3, int) else 0
-   
-    if m1 and m2 and m3:
-        deviation = int(m3 - (m1+m2)/2)
-        if deviation > 0:
-            deviation = f"+{deviation}"
+    rows = _read_exam_rows(path)
+    header = [column.strip().upper() for column in next(rows, [])]
+    
+    if "ADM" not in header:
+        raise ValueError(f"{path}: no ADM column in the header")
+        
+    adm_column = header.index("ADM")
+    stream_column = header.index("STREAM") if "STREAM" in header else None
+    
+    mark_columns = []
+    grade_columns = []
+    
+    for _, subject, _, _ in subjects:
+        if subject.upper() not in header:
+            raise ValueError(f"{path}: no column for {subject}")
+            
+        mark_columns.append(header.index(subject.upper()))
+        grade_column = f"{subject.upper()} GRADE"
+        grade_columns.append(header.index(grade_column) if grade_column in header else None)
         
-    if (m2 and m3) and not m1:
-        deviation = m3 - m2
-        if deviation > 0:
-            deviation = f"+{deviation}"
+    adms = []
+    streams = []
+    marks = array("h")
+    
+    for line, row in enumerate(rows, 2):
+        row = row + [""] * (len(header) - len(row))
+        adm = row[adm_column].strip()
+        
+        if not adm:
+            continue
             
-    if (m1 and m3) and not m2:
-        deviation = m3 - m1
-        if deviation > 0:
-            deviation = f"+{deviation}"
+        adms.append(adm)
+        streams.append(row[stream_column].strip() if stream_column is not None else "")
+        
+        for subject, mark_column, grade_column, expected in zip(subjects, mark_columns, 
+                                                                grade_columns, expected_grades):
+            cell = row[mark_column].strip()
             
-    if (m1 and m2) and not m3:
-        deviation = m2 - m1
-        if deviation > 0:
-            deviation = f"+{deviation}"
+            try:
+                value = float(cell) if cell else -1.0
+                
+                # Marks are whole numbers, 52.5 is a typing error rather than 52
+                if not value.is_integer():
+                    raise ValueError(cell)
+                    
+                mark = int(value)
+            except (ValueError, OverflowError):
+                raise ValueError(f"{path}, line {line}: invalid {subject[1]} mark {cell!r}")
+                
+            if not -1 <= mark <= 100:
+                raise ValueError(f"{path}, line {line}: {subject[1]} mark {mark} is out of range")
+                
+            if grade_column is not None and mark != -1:
+                grade = row[grade_column].strip()
+                
+                if grade and grade != expected[mark]:
+                    raise ValueError(f"{path}, line {line}: {subject[1]} mark {mark} is graded "
+                                     f"{grade}, expected {expected[mark]}")
+                    
+            marks.append(mark)
             
-    return deviation
+    marks = np.frombuffer(marks, dtype=np.int16).reshape(len(adms), len(subjects))
+    
+    return adms, streams, marks
+    
+def _adm_order(adms):
+    # Numeric admission numbers sort as numbers, so 1000 comes after 127
+    if all(adm.isdigit() for adm in adms):
+        return np.argsort(adms.astype(np.int64), kind="stable")
+        
+    return np.arange(len(adms))
+    
+def load_exams(exam1, exam2, exam3, subjects=SUBJECTS, grading=None):
+    """
+    Load the opener, midterm and endterm exam files into a ClassMarks,
+    joining the three on admission number. A student missing from one
+    exam has no marks for it.
+    """
+    exams = [read_exam_file(path, subjects, grading) for path in (exam1, exam2, exam3)]
+    
+    for path, (adms, _, _) in zip((exam1, exam2, exam3), exams):
+        unique_adms, counts = np.unique(adms, return_counts=True)
+        
+        if len(unique_adms) != len(adms):
+            raise ValueError(f"{path}: admission number {unique_adms[counts > 1][0]} appears more than once")
+            
+    # Sort-merge join: every exam's rows are placed by binary search in
+    # the sorted union of admission numbers
+    all_adms = np.unique(np.concatenate([np.array(adms, dtype=str) for adms, _, _ in exams]))
+    
+    marks = np.full((len(all_adms), len(subjects), len(exams)), -1, dtype=np.int16)
+    streams = np.full(len(all_adms), "", dtype=object)
+    
+    for exam, (adms, exam_streams, exam_marks) in enumerate(exams):
+        rows = np.searchsorted(all_adms, np.array(adms, dtype=str))
+        marks[rows, :, exam] = exam_marks
+        
+        exam_streams = np.array(exam_streams, dtype=object)
+        has_stream = exam_streams != ""
+        streams[rows[has_stream]] = exam_streams[has_stream]
+        
+    order = _adm_order(all_adms)
+    
+    return ClassMarks(all_adms[order].tolist(), marks[order], subjects, grading, streams[order].tolist())
     
 def color_table_text(value):
     try:
@@ -113,43 +440,200 @@ def color_table_text(value):
     else:
         return (0, 0, 0)
     
-def draw_progress_graph(x, y, annotations):
-    # DOC TITLE
-    plt.figure(figsize=(10, 2))
-    plt.plot(x, y, linewidth=3.0, marker="o", ms=20)
+### RUN STATISTICS ###
+
+class RunStats:
+    """
+    Timers and counters for a report card run: seconds spent in each
+    stage, counts such as cards written and image bytes embedded, and
+    peak memory. Stage times reported by worker processes are added up,
+    so they are CPU seconds across all workers.
+    """
     
-    ax = plt.gca()
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the run, e.g. with stats.stage("save"): ..."""
+        start = time.perf_counter()
+        
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+            
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+        
+    def as_dict(self):
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+        
+    def merge(self, other):
+        """Add in the stats a worker process returned from as_dict()"""
+        for name, seconds in other["stages"].items():
+            self.stages[name] += seconds
+            
+        for name, amount in other["counters"].items():
+            self.counters[name] += amount
+            
+    def summary(self):
+        """The run's statistics as a JSON-serialisable dict"""
+        elapsed = time.perf_counter() - self.started
+        
+        summary = {
+            "seconds": round(elapsed, 3),
+            "cards_per_sec": round(self.counters["cards"] / elapsed, 2) if elapsed else None,
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "peak_rss_mb": None,
+            "peak_worker_rss_mb": None,
+        }
+        
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux but bytes on macOS
+            scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+            summary["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+            summary["peak_worker_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+            
+        return summary
+        
+    def write(self, path):
+        """Write the summary to path as JSON"""
+        with open(path, "w", encoding="utf-8") as stats_file:
+            json.dump(self.summary(), stats_file, indent=2)
+            
+@contextmanager
+def profiled(path=None):
+    """Run the enclosed code under cProfile and dump the stats to path, if given"""
+    if not path:
+        yield
+        return
+        
+    profiler = cProfile.Profile()
+    profiler.enable()
+    
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        
+### PROGRESS GRAPHS ###
+
+# One figure per process, reused for every student. Building a new figure
+# per card is what made graph drawing the slowest step of the run.
+_graph_template = None
+
+def _setup_progress_axes(ax, marker_size=20):
+    x_pos = range(len(EXAM_NAMES))
+    line, = ax.plot(x_pos, [0] * len(EXAM_NAMES), linewidth=3.0, marker="o", ms=marker_size)
+    
+    ax.set_xticks(x_pos)
+    ax.set_xticklabels(EXAM_NAMES)
+    ax.set_xlim(-0.1, len(EXAM_NAMES) - 0.9)
     ax.spines["top"].set_visible(False)
     ax.spines["right"].set_visible(False)
+    
+    # Customize the plot
+    ax.set_ylabel('Mean Score')
+    ax.grid(linestyle="--", linewidth=0.2, color="b")
+    
+    return line
+    
+def _plot_progress(ax, line, labels, y, annotations):
+    # Missing means ('') are left as gaps in the line
+    y = [val if isinstance(val, (int, float)) else float("nan") for val in y]
+    
+    line.set_ydata(y)
+    
+    while labels:
+        labels.pop().remove()
   
-    for xi, yi, grade in zip(x, y, annotations):
-        plt.annotate(grade,
+    for xi, yi, grade in zip(range(len(y)), y, annotations):
+        if yi != yi:
+            continue
+            
+        labels.append(ax.annotate(grade,
                 xy=(xi, yi), xycoords='data',
                 xytext=(2, 2), textcoords='offset points',
                 bbox=dict(boxstyle="round,pad=0.3", fc="yellow", alpha=0.8),
                 color="blue",
-                weight="bold")
+                weight="bold"))
     
-    # Customize the plot
-    plt.ylabel('Mean Score')
-    plt.grid(linestyle="--", linewidth=0.2, color="b")
-    plt.tight_layout()
+    ax.relim()
+    ax.autoscale_view(scalex=False)
     
-    # Save the plot as an image
-    plot_filename = 'plot.png'
-    plt.savefig(plot_filename)
-    plt.close()
+def _build_graph_template():
+    fig = Figure(figsize=(10, 2))
+    ax = fig.add_subplot()
+    line = _setup_progress_axes(ax)
+    fig.tight_layout()
+    
+    return fig, ax, line, []
+    
+def draw_progress_graph(y, annotations):
+    """Render one progress graph and return the PNG bytes"""
+    global _graph_template
+    
+    if _graph_template is None:
+        _graph_template = _build_graph_template()
         
-    return plot_filename
-
-def print_report_cards(exam1, exam2, exam3):
-    filename = f"report_cards_{time.time()}.docx"
+    fig, ax, line, labels = _graph_template
+    _plot_progress(ax, line, labels, y, annotations)
     
-    studentexams = process_exam_data(exam1, exam2, exam3)
-    out_of = len(studentexams)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+        
+    return buffer.getvalue()
     
-    ### DOCUMENT WRITER ###
+def _draw_progress_graph_job(args):
+    return draw_progress_graph(*args)
     
+def render_progress_graphs(series, workers=None, cache=None, stats=None):
+    """
+    Render a progress graph for every (means, grades) pair in series.
+    Returns a list of BytesIO PNG buffers in the same order. With more
+    than one worker the graphs are rendered in a process pool. Graphs
+    found in cache (a CardCache) are reused instead of drawn again.
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    images = [None] * len(series)
+    
+    if cache is not None:
+        keys = [content_hash("graph", TEMPLATE_VERSION, *args) for args in series]
+        images = [cache.get(key) for key in keys]
+        
+    missing = [i for i, image in enumerate(images) if image is None]
+    to_draw = [series[i] for i in missing]
+    
+    if workers == 1 or len(to_draw) < 2:
+        drawn = [_draw_progress_graph_job(args) for args in to_draw]
+        
+    else:
+        chunksize = max(1, len(to_draw) // (workers * 4))
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            drawn = list(pool.map(_draw_progress_graph_job, to_draw, chunksize=chunksize))
+            
+    for i, image in zip(missing, drawn):
+        images[i] = image
+        
+        if cache is not None:
+            cache.put(keys[i], image)
+            
+    if stats is not None:
+        stats.count("graphs_drawn", len(missing))
+        stats.count("graphs_cached", len(series) - len(missing))
+        stats.count("image_bytes", sum(len(image) for image in images))
+        
+    return [io.BytesIO(image) for image in images]
+
+def new_report_document():
+    """Create an empty report cards document with the page margins set"""
     doc = docx.Document()
     
     #--- SET MARGINS
@@ -160,397 +644,1044 @@ def print_report_cards(exam1, exam2, exam3):
     section.right_margin = Inches(0.8)
     section.left_margin = Inches(0.8)
     
-    # ---------
-    
-    position = 1
+    return doc
     
-    print(" > Generating report cards, please wait...")
-  
-    for adm, exams in studentexams.items():
-        exam_data = exams[0]
-        mean, grade = exams[1]
-        
-        eng1, eng2, eng3 = exam_data[0]
-        eng_dev = calcDeviation(eng1, eng2, eng3)
+def _deviation_text(deviation, has_deviation):
+    if not has_deviation:
+        return "-"
         
-        kis1, kis2, kis3 = exam_data[1]
-        kis_dev = calcDeviation(kis1, kis2, kis3)
-        
-        mat1, mat2, mat3 = exam_data[2]
-        mat_dev = calcDeviation(mat1, mat2, mat3)
-        
-        bio1, bio2, bio3 = exam_data[3]
-        bio_dev = calcDeviation(bio1, bio2, bio3)
+    return f"+{deviation}" if deviation > 0 else str(deviation)
+    
+def card_fields(class_marks, student):
+    """Work out the text of every variable field on a student's report card"""
+    marks = class_marks.marks[student].tolist()
+    grades = class_marks.grades[student].tolist()
+    deviations = class_marks.deviations[student].tolist()
+    has_deviation = class_marks.has_deviation[student].tolist()
+    subject_positions = class_marks.subject_position[student].tolist()
+    subject_out_of = class_marks.subject_out_of[student].tolist()
+    
+    card = {
+        "adm": class_marks.adms[student],
+        "position": class_marks.position[student] or "-",
+        "out_of": class_marks.out_of[student],
+        "stream": class_marks.streams[student],
+        "stream_position": class_marks.stream_position[student] or "-",
+        "stream_out_of": class_marks.stream_out_of[student],
+        "mean_grade": class_marks.mean_grades[student, -1],
+    }
+    
+    for i in range(len(marks)):
+        deviation = _deviation_text(deviations[i], has_deviation[i])
         
-        phy1, phy2, phy3 = exam_data[4]
-        phy_dev = calcDeviation(phy1, phy2, phy3)
+        for exam, (mark, grade) in enumerate(zip(marks[i], grades[i]), 1):
+            card[f"marks_{i}_{exam}"] = f"{mark}  {grade}" if mark != -1 else ""
+            
+        card[f"dev_{i}"] = deviation
+        card[f"dev_color_{i}"] = "%02X%02X%02X" % color_table_text(deviation)
+        card[f"pos_{i}"] = f"{subject_positions[i]}/{subject_out_of[i]}" if subject_positions[i] else "-"
         
-        che1, che2, che3 = exam_data[5]
-        che_dev = calcDeviation(che1, che2, che3)
+    means, mean_grades = class_marks.progress(student)
         
-        his1, his2, his3 = exam_data[6]
-        his_dev = calcDeviation(his1, his2, his3)
+    for exam in range(len(EXAM_NAMES)):
+        card[f"mean_{exam + 1}"] = int(means[exam]) if class_marks.has_mean[student, exam] else ""
+        card[f"grade_{exam + 1}"] = mean_grades[exam]
         
-        geo1, geo2, geo3 = exam_data[7]
-        geo_dev = calcDeviation(geo1, geo2, geo3)
+    card["mean_dev"] = _deviation_text(class_marks.mean_deviations[student], 
+                                       class_marks.has_mean_deviation[student])
+    card["mean_dev_color"] = "%02X%02X%02X" % color_table_text(card["mean_dev"])
+    
+    return {key: str(value) for key, value in card.items()}
+    
+def _set_run_color(run, color):
+    # Set the colour as a raw hex string so template placeholders fit too
+    run.font.color.rgb = RGBColor(0, 0, 0)
+    run._r.rPr.color.set(qn("w:val"), color)
+    
+def write_report_card(doc, card, graph=None, subjects=SUBJECTS, streams=False):
+    """
+    Append one report card (and a page break) to doc. card holds the text
+    of the variable fields, see card_fields(). With streams set the card
+    also shows the student's position in their stream. Returns the
+    paragraph that holds the progress graph.
+    """
+    # WRITE TITLE OF DOCUMENT
+
+    title = doc.add_heading()
+
+    title1 = title.add_run("NEPTUNE ACADEMY\n")
+    title1.font.size = Pt(22)
+    title1.font.name = "Times New Roman"
+    #title1.font.color.rgb = RGBColor.from_string("0000FF")
+      
+    title2 = title.add_run("PRIMARY, JUNIOR AND SENIOR SCHOOLS\n")
+    title2.font.size = Pt(16)
+    title2.font.name = "Times New Roman"
+    title2.font.color.rgb = RGBColor.from_string("FF0000")
+       
+    title3 = title.add_run("P.O BOX 11722 — 00100, UMOJA, NAIROBI\n")
+    title3.font.size = Pt(12)
+    title3.font.name = "Times New Roman"
+    title3.font.color.rgb = RGBColor.from_string("000000")
+       
+    title_format = title.paragraph_format
+    title_format.line_spacing = Pt(20)
+    title_format.space_before = Pt(0)
+    title_format.space_after = Pt(0)
+    title.alignment = 1
+     
+    # ------------- #
+
+    header = doc.add_heading()
+    header_run = header.add_run("STUDENT REPORT CARD")
+    header_run.font.name = "Impact"
+    header_run.font.size = Pt(14)
+    header_run.font.color.rgb = RGBColor.from_string("0047AB")
+    header_run.underline = True
+    
+    header_format = header.paragraph_format
+    header_format.space_before = Pt(0)
+    header_format.space_after = Pt(3)
+    header.alignment = 1
+    
+    ## WRITE STUDENT DETAILS ##
+    
+    name_para = doc.add_paragraph()
+    paragraph_format = name_para.paragraph_format
+    paragraph_format.line_spacing = Pt(13)
+
+    name_para.add_run("NAME ")
+
+    std_name = name_para.add_run(f"     FATUMA ABDI      ")
+    std_name.underline = True
+    std_name.underline = WD_UNDERLINE.DOTTED
+    std_name.bold = True
+    std_name.font.name = "Lucida Calligraphy"
+
+    name_para.add_run("ADM NO. ")
+
+    adm_no = name_para.add_run(f"      {card['adm']}      ")
+    adm_no.underline = True
+    adm_no.underline = WD_UNDERLINE.DOTTED
+    adm_no.bold = True
+    adm_no.font.name = "Lucida Calligraphy"
+
+    name_para.add_run("FORM ")
+
+    form = name_para.add_run(f"      FORM 1     ")
+    form.underline = True
+    form.underline = WD_UNDERLINE.DOTTED
+    form.bold = True
+
+    name_para.add_run("TERM ")
+
+    term = name_para.add_run(f"     TERM 2     ")
+    term.underline = True
+    term.underline = WD_UNDERLINE.DOTTED
+    term.bold = True
+    term.font.name = "Lucida Calligraphy"
+
+    name_para.add_run("EXAM")
+
+    exam = name_para.add_run(f"     ENDTERM     ")
+    exam.underline = True
+    exam.underline = WD_UNDERLINE.DOTTED
+    exam.bold = True
+    exam.font.name = "Lucida Calligraphy"
+
+    # YEAR
+    
+    name_para.add_run("YEAR ")
+
+    year = name_para.add_run(f"     2024     _")
+    year.underline = True
+    year.underline = WD_UNDERLINE.DOTTED
+    year.bold = True
+    year.font.name = "Lucida Calligraphy"
+   
+    position_para = doc.add_paragraph()
+    paragraph_format = position_para.paragraph_format
+    paragraph_format.line_spacing = Pt(15)
+    
+    # POSITION
+    
+    position_para.add_run("MEAN GRADE ")
+
+    mgrade = position_para.add_run(f"         {card['mean_grade']}        ")
+    mgrade.underline = True
+    mgrade.underline = WD_UNDERLINE.DOTTED
+    mgrade.bold = True
+    mgrade.font.name = "Lucida Calligraphy"
+    
+    position_para.add_run("POSITION")
+    
+    pstn = position_para.add_run(f"          {card['position']}          ")
+    pstn.underline = True
+    pstn.underline = WD_UNDERLINE.DOTTED
+    pstn.bold = True
+    pstn.font.name = "Lucida Calligraphy"
+    
+    # OUT OF
+    
+    position_para.add_run("OUT OF")
+    
+    outof = position_para.add_run(f"          {card['out_of']}         _")
+    outof.underline = True
+    outof.underline = WD_UNDERLINE.DOTTED
+    outof.bold = True
+    outof.font.name = "Lucida Calligraphy"
+    
+    # STREAM POSITION
+    
+    if streams:
+        stream_para = doc.add_paragraph()
+        paragraph_format = stream_para.paragraph_format
+        paragraph_format.line_spacing = Pt(15)
         
-        cre1, cre2, cre3 = exam_data[8]
-        cre_dev = calcDeviation(cre1, cre2, cre3)
+        stream_para.add_run("STREAM ")
         
-        agr1, agr2, agr3 = exam_data[9]
-        agr_dev = calcDeviation(agr1, agr2, agr3)
+        strm = stream_para.add_run(f"         {card['stream']}        ")
+        strm.underline = WD_UNDERLINE.DOTTED
+        strm.bold = True
+        strm.font.name = "Lucida Calligraphy"
         
-        com1, com2, com3 = exam_data[10]
-        com_dev = calcDeviation(com1, com2, com3)
+        stream_para.add_run("POSITION")
         
-        bus1, bus2, bus3 = exam_data[11]
-        bus_dev = calcDeviation(bus1, bus2, bus3)
-  
-        printing_data = [
-               (100, "ENGLISH", f"{eng1[0]}  {eng1[1]}", f"{eng2[0]}  {eng2[1]}", f"{eng3[0]}  {eng3[1]}", eng_dev, "Good", "Ondari"),
-               (101, "KISWAHILI", f"{kis1[0]}  {kis1[1]}", f"{kis2[0]}  {kis2[1]}", f"{kis3[0]}  {kis3[1]}", kis_dev, "Good", "Polly"),
-               (202, "MATHEMATICS", f"{mat1[0]}  {mat1[1]}", f"{mat2[0]}  {mat2[1]}", f"{mat3[0]}  {mat3[1]}", mat_dev, "Very Good", "Partrick"),
-               (123, "BIOLOGY", f"{bio1[0]}  {bio1[1]}", f"{bio2[0]}  {bio2[1]}", f"{bio3[0]}  {bio3[1]}", bio_dev, "Good", "Charles"),
-               (342, "PHYSICS", f"{phy1[0]}  {phy1[1]}", f"{phy2[0]}  {phy2[1]}", f"{phy3[0]}  {phy3[1]}", phy_dev, "Excellent", "Wycliffe"),
-               (333, "CHEMISTRY", f"{che1[0]}  {che1[1]}", f"{che2[0]}  {che2[1]}", f"{che3[0]}  {che3[1]}", che_dev, "Good", "Wycliffe"),
-               (331, "HISTORY", f"{his1[0]}  {his1[1]}", f"{his2[0]}  {his2[1]}", f"{his3[0]}  {his3[1]}", his_dev, "Good", "Sandra"),
-               (165, "GEOGRAPHY", f"{geo1[0]}  {geo1[1]}", f"{geo2[0]}  {geo2[1]}", f"{geo3[0]}  {geo3[1]}", geo_dev, "Good", "Miriam"),
-               (112, "CRE", f"{cre1[0]}  {cre1[1]}", f"{cre2[0]}  {cre2[1]}", f"{cre3[0]}  {cre3[1]}", cre_dev, "Poor", "Doris"),
-               (213, "AGRICULTURE", f"{agr1[0]}  {agr1[1]}", f"{agr2[0]}  {agr2[1]}", f"{agr3[0]}  {agr3[1]}", agr_dev, "Good", "Charles"),
-               (445, "COMPUTER", f"{com1[0]}  {com1[1]}", f"{com2[0]}  {com2[1]}", f"{com3[0]}  {com3[1]}", com_dev, "Good", "Erick"),
-               (559, "BUSINESS", f"{bus1[0]}  {bus1[1]}", f"{bus2[0]}  {bus2[1]}", f"{bus3[0]}  {bus3[1]}", bus_dev, "Exellent", "Jackline"),
-            ] 
-        
-        dev_sum_tt = calcDevSum(mean[0],mean[1],mean[2])
-            
-        totals_data = [
-               ("", "", "", "", "", "", ""),
-               ("MEAN", "", mean[0], mean[1], mean[2], dev_sum_tt, ""),
-               ("GRADE", "", grade[0], grade[1], grade[2], "", ""),
-               ("", "", "", "", "", "", ""),
-            ]
-           
-        # WRITE TITLE OF DOCUMENT
-    
-        title = doc.add_heading()
-    
-        title1 = title.add_run("NEPTUNE ACADEMY\n")
-        title1.font.size = Pt(22)
-        title1.font.name = "Times New Roman"
-        #title1.font.color.rgb = RGBColor.from_string("0000FF")
-          
-        title2 = title.add_run("PRIMARY, JUNIOR AND SENIOR SCHOOLS\n")
-        title2.font.size = Pt(16)
-        title2.font.name = "Times New Roman"
-        title2.font.color.rgb = RGBColor.from_string("FF0000")
-           
-        title3 = title.add_run("P.O BOX 11722 — 00100, UMOJA, NAIROBI\n")
-        title3.font.size = Pt(12)
-        title3.font.name = "Times New Roman"
-        title3.font.color.rgb = RGBColor.from_string("000000")
-           
-        title_format = title.paragraph_format
-        title_format.line_spacing = Pt(20)
-        title_format.space_before = Pt(0)
-        title_format.space_after = Pt(0)
-        title.alignment = 1
-         
-        # ------------- #
-    
-        header = doc.add_heading()
-        header_run = header.add_run("STUDENT REPORT CARD")
-        header_run.font.name = "Impact"
-        header_run.font.size = Pt(14)
-        header_run.font.color.rgb = RGBColor.from_string("0047AB")
-        header_run.underline = True
-        
-        header_format = header.paragraph_format
-        header_format.space_before = Pt(0)
-        header_format.space_after = Pt(3)
-        header.alignment = 1
+        strm_pstn = stream_para.add_run(f"          {card['stream_position']}          ")
+        strm_pstn.underline = WD_UNDERLINE.DOTTED
+        strm_pstn.bold = True
+        strm_pstn.font.name = "Lucida Calligraphy"
         
-        ## WRITE STUDENT DETAILS ##
+        stream_para.add_run("OUT OF")
         
-        name_para = doc.add_paragraph()
-        paragraph_format = name_para.paragraph_format
-        paragraph_format.line_spacing = Pt(13)
+        strm_outof = stream_para.add_run(f"          {card['stream_out_of']}         _")
+        strm_outof.underline = WD_UNDERLINE.DOTTED
+        strm_outof.bold = True
+        strm_outof.font.name = "Lucida Calligraphy"
 
-        name_para.add_run("NAME ")
+    # ADD MARKS 
 
-        std_name = name_para.add_run(f"     FATUMA ABDI      ")
-        std_name.underline = True
-        std_name.underline = WD_UNDERLINE.DOTTED
-        std_name.bold = True
-        std_name.font.name = "Lucida Calligraphy"
+    table1 = doc.add_table(rows = 1, cols = 9)
+    table1.style = doc.styles["Table Grid"]
 
-        name_para.add_run("ADM NO. ")
+    table1.columns[0].width = Cm(1.5)
+    table1.columns[1].width = Cm(6.5)
+    table1.columns[2].width = Cm(3.5)
+    table1.columns[3].width = Cm(3.5)
+    table1.columns[4].width = Cm(3.5)
+    table1.columns[5].width = Cm(2.5)
+    table1.columns[6].width = Cm(2.5)
+    table1.columns[7].width = Cm(5.5)
+    table1.columns[8].width = Cm(4.5)
 
-        adm_no = name_para.add_run(f"      {adm}      ")
-        adm_no.underline = True
-        adm_no.underline = WD_UNDERLINE.DOTTED
-        adm_no.bold = True
-        adm_no.font.name = "Lucida Calligraphy"
+    cells = table1.rows[0].cells
 
-        name_para.add_run("FORM ")
+    cells[0].text = "CODE"
+    cells[0].width = Cm(1.5)
 
-        form = name_para.add_run(f"      FORM 1     ")
-        form.underline = True
-        form.underline = WD_UNDERLINE.DOTTED
-        form.bold = True
+    cells[1].text = "SUBJECTS"
+    cells[1].width = Cm(6.5)
 
-        name_para.add_run("TERM ")
-
-        term = name_para.add_run(f"     TERM 2     ")
-        term.underline = True
-        term.underline = WD_UNDERLINE.DOTTED
-        term.bold = True
-        term.font.name = "Lucida Calligraphy"
+    cells[2].text = "Opener"
+    cells[2].width = Cm(3.5)
+    
+    cells[3].text = "Midterm"
+    cells[3].width = Cm(3.5)
+    
+    cells[4].text = "Endterm"
+    cells[4].width = Cm(3.5)
+    
+    cells[5].text = "Dev"
+    cells[5].width = Cm(2.5)
 
-        name_para.add_run("EXAM")
+    cells[6].text = "Pos"
+    cells[6].width = Cm(2.5)
 
-        exam = name_para.add_run(f"     ENDTERM     ")
-        exam.underline = True
-        exam.underline = WD_UNDERLINE.DOTTED
-        exam.bold = True
-        exam.font.name = "Lucida Calligraphy"
+    cells[7].text = "REMARKS"
+    cells[7].width = Cm(5.5)
 
-        # YEAR
+    cells[8].text = "TEACHER"
+    cells[8].width = Cm(4.5)
+       
+    #----
+    for i, (code, subject, remark, sign) in enumerate(subjects):
+        row_cells = table1.add_row().cells
+    
+        row_cells[0].text = str(code)
+        row_cells[1].text = subject
+        row_cells[2].text = card[f"marks_{i}_1"]
+        row_cells[3].text = card[f"marks_{i}_2"]
+        row_cells[4].text = card[f"marks_{i}_3"]
+        row_cells[5].text = card[f"dev_{i}"]
+        _set_run_color(row_cells[5].paragraphs[0].runs[0], card[f"dev_color_{i}"])
+        row_cells[6].text = card[f"pos_{i}"]
+        row_cells[7].text = remark
+        row_cells[8].text = sign
+        
+    totals_data = [
+           ("", "", "", "", "", "000000"),
+           ("MEAN", card["mean_1"], card["mean_2"], card["mean_3"], card["mean_dev"], card["mean_dev_color"]),
+           ("GRADE", card["grade_1"], card["grade_2"], card["grade_3"], "", "000000"),
+           ("", "", "", "", "", "000000"),
+        ]
+        
+    for row in totals_data:
+        rowname, mean1, mean2, mean3, devs, devs_color = row
         
-        name_para.add_run("YEAR ")
+        row_cells = table1.add_row().cells
+    
+        row_cells[0].merge(row_cells[1])
+    
+        row_cells[0].text = rowname
+        row_cells[1].text = ""
+        row_cells[2].text = mean1
+        row_cells[3].text = mean2
+        row_cells[4].text = mean3
+        row_cells[5].text = devs
+        _set_run_color(row_cells[5].paragraphs[0].runs[0], devs_color)
 
-        year = name_para.add_run(f"     2024     _")
-        year.underline = True
-        year.underline = WD_UNDERLINE.DOTTED
-        year.bold = True
-        year.font.name = "Lucida Calligraphy"
-       
-        position_para = doc.add_paragraph()
-        paragraph_format = position_para.paragraph_format
-        paragraph_format.line_spacing = Pt(15)
+        row_cells[6].text = ""
+        row_cells[7].text = ""
+        row_cells[8].text = ""
+    
+    ####----------
+    clstrs_comment = CLASS_TEACHER_COMMENT
+    hdtrs_comment = HEAD_TEACHER_COMMENT
+    sch_closing_date = SCHOOL_CLOSING_DATE
+    sch_opening_date = SCHOOL_OPENING_DATE
+    
+    progress_heading = doc.add_heading()
+    remarks_ = progress_heading.add_run("GRAPHICAL PROGRESS", 0)
+    remarks_.font.name = "Times New Roman"
+    remarks_.font.size = Pt(11)
+    remarks_.font.color.rgb = RGBColor.from_string("0047AB")
+     
+    prog_format = progress_heading.paragraph_format
+    prog_format.space_after = Pt(1)
+    prog_format.space_after = Pt(1)
+    
+    ## Add Progress Graph To Document
+    
+    graph_para = doc.add_paragraph()
+    if graph is not None:
+        graph_para.add_run().add_picture(graph, width=Inches(5))
+    graph_para.alignment = 1
+    #doc.add_picture(graph, width=Inches(5))
+    
+    ####----------####
+    
+    ct_trs_remark = doc.add_paragraph()
+    ct_beg = ct_trs_remark.add_run("CLASS TEACHER'S COMMENTS:")
+    ct_beg.font.color.rgb = RGBColor.from_string("0047AB")
+    ct_beg.font.size = Pt(11)
+    ct_beg.bold = True
+    
+    ct_comment = ct_trs_remark.add_run(f"     {clstrs_comment}   _\n")
+    ct_comment.underline = True
+    ct_comment.underline = WD_UNDERLINE.DOTTED
+    ct_comment.bold = True
+    ct_comment.font.name = "Lucida Calligraphy"
+    
+    ct_trs_remark.add_run(f"Date: ")
+    ct_trs_remark.add_run("."*50)
+    ct_trs_remark.add_run(" "*10)
+    ct_trs_remark.add_run("Signature: ")
+    ct_trs_remark.add_run("."*50)
+
+    next_term = doc.add_paragraph("School has closed today on ")
+    term_date_closing = next_term.add_run(f"       {sch_closing_date}         _")
+    term_date_closing.underline = True
+    term_date_closing.underline = WD_UNDERLINE.DOTTED
+    term_date_closing.bold = True
+    term_date_closing.font.name = "Lucida Calligraphy"
+    
+    next_term.add_run(" and reopens next time on ") 
+    term_date_opening = next_term.add_run(f"       {sch_opening_date}         _")
+    term_date_opening.underline = True
+    term_date_opening.underline = WD_UNDERLINE.DOTTED
+    term_date_opening.bold = True
+    term_date_opening.font.name = "Lucida Calligraphy"
+    
+    parent_seen = doc.add_paragraph("Parent / Guardian's Signature:  ")
+    parent_seen.add_run("."*80)
+ 
+    ##### GRADING SYSTEM ######
+    
+    grd = doc.add_paragraph("")
+    
+    
+    grading1 = GRADING_SYSTEM["SCIENCE"]
+    grading2 = GRADING_SYSTEM["GENERAL"]
+
+    form12_run = grd.add_run("FORM 1 & 2 (MARKS): ")
+    form12_run.font.size = Pt(10)
+    form12_run.underline = True
+ 
+    for k,v in grading1.items():
+        grdvals = "–".join([str(i) for i in v[0]])
+        grd_key = grd.add_run(f"{k}: ")
+        grd_key.font.size = Pt(10)
+        grd_key.bold = True
+        
+        grd_val = grd.add_run(f"{grdvals};  ")
+        grd_val.font.size = Pt(10)
+        
+    form34_run = grd.add_run("FORM 3 & 4 (POINTS): ")
+    form34_run.font.size = Pt(10)
+    form34_run.underline = True
+    
+    for k,v in grading2.items():
+        grdvals = "–".join([str(i) for i in v[0]])
+        grd_key = grd.add_run(f"{k}: ")
+        grd_key.font.size = Pt(10)
+        grd_key.bold = True
         
-        # POSITION
+        grd_val = grd.add_run(f"{grdvals};  ")
+        grd_val.font.size = Pt(10)
         
-        '''
-        To get the actual position of student in class, you need to sort
-        the studentexams data in descending order. The student with the highest marks
-        will be in position number 1.
-        '''
-        position_para.add_run("MEAN GRADE ")
+    #-------------
+    
+    doc.add_page_break()
+    
+    return graph_para
+    
+### CARD TEMPLATE ###
 
-        mgrade = position_para.add_run(f"         {grade[-1]}        ")
-        mgrade.underline = True
-        mgrade.underline = WD_UNDERLINE.DOTTED
-        mgrade.bold = True
-        mgrade.font.name = "Lucida Calligraphy"
+class _TemplateFields(dict):
+    """Field values for building a template: every field becomes {name}"""
+    
+    def __missing__(self, key):
+        return "{" + key + "}"
         
-        position_para.add_run("POSITION")
+class ReportCardTemplate:
+    """
+    A report card laid out once with placeholders in its variable fields.
+    Each student's card is a deep copy of the template's XML with only the
+    placeholders filled in, instead of rebuilding every run and table cell.
+    """
+    
+    def __init__(self, subjects=SUBJECTS, streams=False):
+        scratch = new_report_document()
+        graph_para = write_report_card(scratch, _TemplateFields(), subjects=subjects, streams=streams)
         
-        pstn = position_para.add_run(f"          {position}          ")
-        pstn.underline = True
-        pstn.underline = WD_UNDERLINE.DOTTED
-        pstn.bold = True
-        pstn.font.name = "Lucida Calligraphy"
+        self.elements = [element for element in scratch.element.body.iterchildren()
+                         if element.tag != qn("w:sectPr")]
+        self.graph_index = self.elements.index(graph_para._p)
         
-        # OUT OF
+        # Static elements (title, grading legend...) are copied as they are
+        self.has_fields = [any("{" in (node.text or node.get(qn("w:val"), "")) 
+                               for node in element.iter(qn("w:t"), qn("w:color")))
+                           for element in self.elements]
         
-        position_para.add_run("OUT OF")
+    def render(self, doc, card, graph=None):
+        """Append a filled in copy of the template to doc"""
+        body = doc.element.body
         
-        outof = position_para.add_run(f"          {out_of}         _")
-        outof.underline = True
-        outof.underline = WD_UNDERLINE.DOTTED
-        outof.bold = True
-        outof.font.name = "Lucida Calligraphy"
-
-        # ADD MARKS 
-
-        table1 = doc.add_table(rows = 1, cols = 8)
-        table1.style = doc.styles["Table Grid"]
+        for index, element in enumerate(self.elements):
+            clone = copy.deepcopy(element)
+            
+            if self.has_fields[index]:
+                for node in clone.iter(qn("w:t"), qn("w:color")):
+                    if node.tag == qn("w:t"):
+                        if node.text and "{" in node.text:
+                            node.text = node.text.format_map(card)
+                            
+                    elif "{" in node.get(qn("w:val")):
+                        node.set(qn("w:val"), node.get(qn("w:val")).format_map(card))
+                        
+            if index == self.graph_index and graph is not None:
+                Paragraph(clone, doc._body).add_run().add_picture(graph, width=Inches(5))
+                
+            body.sectPr.addprevious(clone)
+            
+_card_templates = {}
 
-        table1.columns[0].width = Cm(1.5)
-        table1.columns[1].width = Cm(6.5)
-        table1.columns[2].width = Cm(3.5)
-        table1.columns[3].width = Cm(3.5)
-        table1.columns[4].width = Cm(3.5)
-        table1.columns[5].width = Cm(2.5)
-        table1.columns[6].width = Cm(8.0)
-        table1.columns[7].width = Cm(4.5)
+def get_card_template(subjects=SUBJECTS, streams=False):
+    """Return this process's report card template, building it on first use"""
+    key = (tuple(subjects), streams)
+    
+    if key not in _card_templates:
+        _card_templates[key] = ReportCardTemplate(subjects, streams)
+        
+    return _card_templates[key]
 
-        cells = table1.rows[0].cells
+### BUILD CACHE ###
 
-        cells[0].text = "CODE"
-        cells[0].width = Cm(1.5)
+def content_hash(*parts):
+    """A stable hash of JSON-serialisable parts, used as a cache key"""
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+    
+class CardCache:
+    """
+    An on-disk cache of rendered report card pieces, such as progress
+    graphs, stored by content hash. Reading an entry marks it as recently
+    used, and evict() removes the least recently used entries once the
+    cache is larger than max_bytes.
+    """
+    
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+        
+    def get(self, key):
+        """Return the cached bytes for key, or None"""
+        path = self._path(key)
+        
+        try:
+            with open(path, "rb") as cached:
+                data = cached.read()
+            os.utime(path)
+        except OSError:
+            return None
+            
+        return data
+        
+    def put(self, key, data):
+        """Store data under key"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        partial_path = f"{path}.{os.getpid()}.part"
+        
+        with open(partial_path, "wb") as cached:
+            cached.write(data)
+            
+        os.replace(partial_path, path)
+        
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                    
+                entries.append((stat.st_mtime, stat.st_size, path))
+                
+        total = sum(size for _, size, _ in entries)
+        
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+                
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+                
+            total -= size
+            
+### SHARDED OUTPUT ###
 
-        cells[1].text = "SUBJECTS"
-        cells[1].width = Cm(6.5)
+def _shard_filename(index, cards, shard_size, extension=".docx"):
+    if shard_size == 1:
+        adm = str(cards[0][0])
+        safe_adm = re.sub(r"[^\w-]", "-", adm)
+        
+        # Admission numbers like 2024/127 cannot be file names as they are, and the
+        # shard number keeps 2024/127 and 2024-127 from sharing a file
+        if safe_adm != adm:
+            return f"report_card_{safe_adm}_{index:04d}{extension}"
+            
+        return f"report_card_{adm}{extension}"
+        
+    return f"report_cards_{index:04d}{extension}"
+    
+def write_report_shard(path, cards, subjects=SUBJECTS, streams=False, cache=None):
+    """
+    Write one shard of report cards to its own document. cards is a list
+    of (adm, card fields, progress) tuples. The document is saved under a
+    temporary name first so an interrupted run never leaves a half
+    written shard behind. Returns the shard's RunStats.as_dict().
+    """
+    stats = RunStats()
+    
+    with stats.stage("graphs"):
+        graphs = render_progress_graphs([progress for _, _, progress in cards], 1, cache, stats)
+    
+    with stats.stage("cards"):
+        doc = new_report_document()
+        template = get_card_template(subjects, streams)
+        
+        for (_, card, _), graph in zip(cards, graphs):
+            template.render(doc, card, graph)
+            
+    with stats.stage("save"):
+        partial_path = path + ".part"
+        doc.save(partial_path)
+        os.replace(partial_path, path)
+        
+    stats.count("cards", len(cards))
+    
+    return stats.as_dict()
+    
+def merge_report_cards(paths, filename):
+    """Merge shard documents, in order, into a single document"""
+    master = docx.Document(paths[0])
+    body = master.element.body
+    
+    for path in paths[1:]:
+        shard = docx.Document(path)
+        
+        for element in shard.element.body.iterchildren():
+            if element.tag == qn("w:sectPr"):
+                continue
+                
+            # Pictures point at the shard's own image parts, copy them over
+            for blip in element.iter(qn("a:blip")):
+                image_part = shard.part.related_parts[blip.get(qn("r:embed"))]
+                rId, _ = master.part.get_or_add_image(io.BytesIO(image_part.blob))
+                blip.set(qn("r:embed"), rId)
+                
+            body.sectPr.addprevious(element)
+            
+    # Drawing ids must be unique within the merged document
+    for shape_id, doc_pr in enumerate(body.iter(qn("wp:docPr")), 1):
+        doc_pr.set("id", str(shape_id))
+        
+    master.save(filename)
+    
+    return filename
+    
+### PDF BACKEND ###
 
-        cells[2].text = "Opener"
-        cells[2].width = Cm(3.5)
+def _legend_text(bands):
+    return ";  ".join(f"{grade}: {band[0][0]}–{band[0][1]}" for grade, band in bands.items())
+    
+class PdfCardTemplate:
+    """
+    The report card laid out once as an A4 matplotlib figure, with the
+    same sections as the Word card. Each student's page is drawn by
+    changing only the variable texts and the progress line, and is then
+    appended to a PdfPages file, so pages go to disk as they are made.
+    """
+    
+    BLUE = "#0047AB"
+    
+    # Table rows are ROW_HEIGHT of the page tall at FONT_SIZE, and shrink
+    # (down to MIN_FONT_SIZE) when there are too many subjects for the
+    # table, graph and comments to fit on one page
+    ROW_HEIGHT = 0.0193
+    FONT_SIZE = 8
+    MIN_FONT_SIZE = 6
+    
+    # Everything from the class teacher's comments down is laid out from
+    # the bottom of the page, the graph takes the space left above it
+    COMMENTS_TOP = 0.26
+    MIN_GRAPH_HEIGHT = 0.08
+    
+    def __init__(self, subjects=SUBJECTS, streams=False):
+        self.fig = Figure(figsize=(8.27, 11.69))
+        self.fields = []
+        fig = self.fig
         
-        cells[3].text = "Midterm"
-        cells[3].width = Cm(3.5)
+        # WRITE TITLE OF DOCUMENT
+        
+        fig.text(0.5, 0.965, "NEPTUNE ACADEMY", ha="center", size=22, family="serif")
+        fig.text(0.5, 0.942, "PRIMARY, JUNIOR AND SENIOR SCHOOLS", ha="center", size=16, 
+                 family="serif", color="red")
+        fig.text(0.5, 0.922, "P.O BOX 11722 — 00100, UMOJA, NAIROBI", ha="center", size=12, family="serif")
+        fig.text(0.5, 0.898, "STUDENT REPORT CARD", ha="center", size=14, weight="bold", color=self.BLUE)
+        
+        ## WRITE STUDENT DETAILS ##
+        
+        self._field(0.06, 0.872, "NAME:  FATUMA ABDI    ADM NO.:  {adm}    FORM:  FORM 1    "
+                                 "TERM:  TERM 2    EXAM:  ENDTERM    YEAR:  2024")
+        self._field(0.06, 0.852, "MEAN GRADE:  {mean_grade}      POSITION:  {position}      OUT OF:  {out_of}")
+        
+        if streams:
+            self._field(0.06, 0.832, "STREAM:  {stream}      POSITION:  {stream_position}      "
+                                     "OUT OF:  {stream_out_of}")
+        
+        # ADD MARKS
+        
+        headers = ["CODE", "SUBJECTS", "Opener", "Midterm", "Endterm", "Dev", "Pos", "REMARKS", "TEACHER"]
+        widths = np.array([2.0, 6.5, 3.5, 3.5, 3.5, 2.5, 2.5, 5.5, 4.5])
+        
+        rows = [[str(code), subject, f"{{marks_{i}_1}}", f"{{marks_{i}_2}}", f"{{marks_{i}_3}}", 
+                 f"{{dev_{i}}}", f"{{pos_{i}}}", remark, sign] 
+                for i, (code, subject, remark, sign) in enumerate(subjects)]
+        rows += [[""] * 9, 
+                 ["", "MEAN", "{mean_1}", "{mean_2}", "{mean_3}", "{mean_dev}", "", "", ""],
+                 ["", "GRADE", "{grade_1}", "{grade_2}", "{grade_3}", "", "", "", ""],
+                 [""] * 9]
+        
+        colors = [f"{{dev_color_{i}}}" for i in range(len(subjects))] + [None, "{mean_dev_color}", None, None]
+        
+        table_top = 0.812 if streams else 0.832
+        
+        # Room for the table once the graph heading, the smallest graph and
+        # the comments are placed below it
+        room = table_top - (self.COMMENTS_TOP + 0.03 + self.MIN_GRAPH_HEIGHT + 0.07)
+        row_height = min(self.ROW_HEIGHT, room / (len(rows) + 1))
+        font_size = self.FONT_SIZE * row_height / self.ROW_HEIGHT
+        
+        if font_size < self.MIN_FONT_SIZE:
+            raise ValueError(f"{len(subjects)} subjects do not fit on a PDF report card")
+            
+        table_bottom = table_top - row_height * (len(rows) + 1)
+        table_ax = fig.add_axes([0.06, table_bottom, 0.88, table_top - table_bottom])
+        table_ax.axis("off")
+        
+        table = table_ax.table(cellText=[headers] + rows, colWidths=widths / widths.sum(), 
+                               cellLoc="left", bbox=[0, 0, 1, 1])
+        table.auto_set_font_size(False)
+        table.set_fontsize(font_size)
+        
+        for (row, col), cell in table.get_celld().items():
+            text = cell.get_text()
+            
+            if row == 0:
+                text.set_weight("bold")
+                
+            elif "{" in text.get_text():
+                self.fields.append((text, text.get_text(), colors[row - 1] if col == 5 else None))
+                
+        # GRAPHICAL PROGRESS
+        
+        heading_y = table_bottom - 0.05
+        fig.text(0.06, heading_y, "GRAPHICAL PROGRESS", size=11, weight="bold", color=self.BLUE)
+        
+        graph_bottom = self.COMMENTS_TOP + 0.03
+        self.graph_ax = fig.add_axes([0.14, graph_bottom, 0.76, heading_y - 0.02 - graph_bottom])
+        self.graph_line = _setup_progress_axes(self.graph_ax, marker_size=10)
+        self.graph_labels = []
+        
+        # COMMENTS
+        
+        fig.text(0.06, 0.24, "CLASS TEACHER'S COMMENTS:", size=10, weight="bold", color=self.BLUE)
+        fig.text(0.06, 0.232, textwrap.fill(CLASS_TEACHER_COMMENT, 100), size=9, style="italic", va="top")
+        fig.text(0.06, 0.18, f"Date: {'.' * 50}          Signature: {'.' * 50}", size=9)
+        fig.text(0.06, 0.16, f"School has closed today on  {SCHOOL_CLOSING_DATE}  and reopens "
+                             f"next time on  {SCHOOL_OPENING_DATE}", size=9)
+        fig.text(0.06, 0.14, f"Parent / Guardian's Signature:  {'.' * 80}", size=9)
         
-        cells[4].text = "Endterm"
-        cells[4].width = Cm(3.5)
-        
-        cells[5].text = "Dev"
-        cells[5].width = Cm(2.5)
-
-        cells[6].text = "REMARKS"
-        cells[6].width = Cm(8.0)
-
-        cells[7].text = "TEACHER"
-        cells[7].width = Cm(4.5)
-           
-        #----
-        for row in printing_data:
-            code, subject, marks1, marks2, marks3, deviation, remark, sign = row
-            
-            r, g , b = color_table_text(deviation)
-            
-            row_cells = table1.add_row().cells
-        
-            row_cells[0].text = str(code)
-            row_cells[1].text = subject
-            row_cells[2].text = str(marks1) if not re.match("-1",marks1) else "" 
-            row_cells[3].text = str(marks2) if not re.match("-1",marks2) else "" 
-            row_cells[4].text = str(marks3) if not re.match("-1",marks3) else "" 
-            row_cells[5].text = str(deviation)
-            row_cells[5].paragraphs[0].runs[0].font.color.rgb = RGBColor(r, g , b)
-            row_cells[6].text = remark
-            row_cells[7].text = sign
-            
-        for row in totals_data:
-            rowname, _, mean1, mean2, mean3, devs, _ = row
-            
-            r, g , b = color_table_text(devs)
-            
-            row_cells = table1.add_row().cells
-        
-            row_cells[0].merge(row_cells[1])
-        
-            row_cells[0].text = rowname
-            row_cells[1].text = ""
-            row_cells[2].text = str(mean1)
-            row_cells[3].text = str(mean2)
-            row_cells[4].text = str(mean3)
-            row_cells[5].text = str(devs)
-            row_cells[5].paragraphs[0].runs[0].font.color.rgb = RGBColor(r, g , b)
-
-            row_cells[6].text = ""
-            row_cells[7].text = ""
-        
-        ####----------
-        clstrs_comment = "Your progress is amazing. I have no doubt that next time you will soar as high as an eagle. Keep up the good work and never give up."
-        hdtrs_comment = "You are a reader. Keep up your good work and never give up. Success is fo those who study well."
-        sch_closing_date = "Monday 01 August, 2024"
-        sch_opening_date= "Wednesday 27 August, 2024"
-        
-        progress_heading = doc.add_heading()
-        remarks_ = progress_heading.add_run("GRAPHICAL PROGRESS", 0)
-        remarks_.font.name = "Times New Roman"
-        remarks_.font.size = Pt(11)
-        remarks_.font.color.rgb = RGBColor.from_string("0047AB")
-         
-        prog_format = progress_heading.paragraph_format
-        prog_format.space_after = Pt(1)
-        prog_format.space_after = Pt(1)
-        
-        # Draw Progress Graph
-        
-        x_vals = ["Opener", "Midterm", "Endterm"]
-        y_vals = [mean[0], mean[1], mean[2]]
-         
-        graph = draw_progress_graph(x_vals, y_vals, grade)
-        
-        ## Add Progress Graph To Document
-        
-        graph_para = doc.add_paragraph()
-        graph_para_run = graph_para.add_run().add_picture(graph, width=Inches(5))
-        graph_para.alignment = 1
-        #doc.add_picture(graph, width=Inches(5))
-        
-        ####----------####
-        
-        ct_trs_remark = doc.add_paragraph()
-        ct_beg = ct_trs_remark.add_run("CLASS TEACHER'S COMMENTS:")
-        ct_beg.font.color.rgb = RGBColor.from_string("0047AB")
-        ct_beg.font.size = Pt(11)
-        ct_beg.bold = True
-        
-        ct_comment = ct_trs_remark.add_run(f"     {clstrs_comment}   _\n")
-        ct_comment.underline = True
-        ct_comment.underline = WD_UNDERLINE.DOTTED
-        ct_comment.bold = True
-        ct_comment.font.name = "Lucida Calligraphy"
-        
-        ct_trs_remark.add_run(f"Date: ")
-        ct_trs_remark.add_run("."*50)
-        ct_trs_remark.add_run(" "*10)
-        ct_trs_remark.add_run("Signature: ")
-        ct_trs_remark.add_run("."*50)
-
-        next_term = doc.add_paragraph("School has closed today on ")
-        term_date_closing = next_term.add_run(f"       {sch_closing_date}         _")
-        term_date_closing.underline = True
-        term_date_closing.underline = WD_UNDERLINE.DOTTED
-        term_date_closing.bold = True
-        term_date_closing.font.name = "Lucida Calligraphy"
-        
-        next_term.add_run(" and reopens next time on ") 
-        term_date_opening = next_term.add_run(f"       {sch_opening_date}         _")
-        term_date_opening.underline = True
-        term_date_opening.underline = WD_UNDERLINE.DOTTED
-        term_date_opening.bold = True
-        term_date_opening.font.name = "Lucida Calligraphy"
-        
-        parent_seen = doc.add_paragraph("Parent / Guardian's Signature:  ")
-        parent_seen.add_run("."*80)
-     
         ##### GRADING SYSTEM ######
         
-        grd = doc.add_paragraph("")
+        legend = (f"FORM 1 & 2 (MARKS): {_legend_text(GRADING_SYSTEM['SCIENCE'])}    "
+                  f"FORM 3 & 4 (POINTS): {_legend_text(GRADING_SYSTEM['GENERAL'])}")
+        fig.text(0.06, 0.115, textwrap.fill(legend, 130), size=7, va="top")
+        
+    def _field(self, x, y, text_format, **style):
+        text = self.fig.text(x, y, "", size=9, **style)
+        self.fields.append((text, text_format, None))
+        
+    def render(self, pdf, card, progress):
+        """Fill in the fields for card and save the page to pdf (a PdfPages)"""
+        for text, text_format, color in self.fields:
+            text.set_text(text_format.format_map(card))
+            
+            if color:
+                text.set_color("#" + color.format_map(card))
+                
+        means, grades = progress
+        _plot_progress(self.graph_ax, self.graph_line, self.graph_labels, means, grades)
         
-        data = [{'_id': 'DB_GRD_001', 'SCIENCE': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'LANGUAGES': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'HUMANITIES': {'E': [[0, 14], 1], 'D-': [[15, 19], 2], 'D': [[20, 29], 3], 'D+': [[30, 34], 4], 'C-': [[35, 39], 5], 'C': [[40, 44], 6], 'C+': [[45, 49], 7], 'B-': [[50, 54], 8], 'B': [[55, 59], 9], 'B+': [[60, 64], 10], 'A-': [[65, 69], 11], 'A': [[70, 100], 12]}, 'GENERAL': {'E': [[7, 10], 1, 'POOR'], 'D-': [[11, 17], 2, 'WEAK'], 'D': [[18, 24], 3, 'WEAK'], 'D+': [[25, 31], 4, 'WEAK'], 'C-': [[32, 38], 5, 'AVERAGE'], 'C': [[39, 45], 6, 'AVERAGE'], 'C+': [[46, 52], 7, 'AVERAGE'], 'B-': [[53, 59], 8, 'GOOD'], 'B': [[60, 66], 9, 'GOOD'], 'B+': [[67, 73], 10, 'GOOD'], 'A-': [[74, 80], 11, 'VERY GOOD'], 'A': [[81, 84], 12, 'VERY GOOD']}}]
+        pdf.savefig(self.fig)
         
-        grading1 = data[0]["SCIENCE"]
-        grading2 = data[0]["GENERAL"]
+_pdf_templates = {}
 
-        form12_run = grd.add_run("FORM 1 & 2 (MARKS): ")
-        form12_run.font.size = Pt(10)
-        form12_run.underline = True
- 
-        for k,v in grading1.items():
-            grdvals = "–".join([str(i) for i in v[0]])
-            grd_key = grd.add_run(f"{k}: ")
-            grd_key.font.size = Pt(10)
-            grd_key.bold = True
+def get_pdf_template(subjects=SUBJECTS, streams=False):
+    """Return this process's PDF card template, building it on first use"""
+    key = (tuple(subjects), streams)
+    
+    if key not in _pdf_templates:
+        _pdf_templates[key] = PdfCardTemplate(subjects, streams)
+        
+    return _pdf_templates[key]
+    
+def write_pdf_shard(path, cards, subjects=SUBJECTS, streams=False, cache=None):
+    """
+    Write report cards to a PDF, one page per card, in the same way as
+    write_report_shard(). The progress graphs are drawn straight onto
+    the page, so the graph cache is not used.
+    """
+    stats = RunStats()
+    
+    with stats.stage("pdf_pages"):
+        template = get_pdf_template(subjects, streams)
+        partial_path = path + ".part"
+        
+        with PdfPages(partial_path) as pdf:
+            for _, card, progress in cards:
+                template.render(pdf, card, progress)
+                
+        os.replace(partial_path, path)
+        
+    stats.count("cards", len(cards))
+    
+    return stats.as_dict()
+    
+def merge_pdf_shards(paths, filename):
+    """Merge shard PDFs, in order, into a single PDF (needs pypdf)"""
+    from pypdf import PdfWriter
+    
+    writer = PdfWriter()
+    
+    for path in paths:
+        writer.append(path)
+        
+    with open(filename, "wb") as merged:
+        writer.write(merged)
+        
+    return filename
+    
+def write_pdf_parallel(filename, cards, subjects=SUBJECTS, streams=False, workers=None):
+    """
+    Write report cards to a single PDF, drawing the pages in a pool of
+    worker processes: each worker writes one contiguous part to a
+    temporary PDF and the parts are then merged in order. With one
+    worker, or without pypdf to merge with, the pages are drawn here.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(cards))
+    
+    if workers <= 1 or importlib.util.find_spec("pypdf") is None:
+        return write_pdf_shard(filename, cards, subjects, streams)
+        
+    stats = RunStats()
+    part_size = -(-len(cards) // workers)
+    part_dir = tempfile.mkdtemp(prefix=".report_cards_", dir=os.path.dirname(os.path.abspath(filename)))
+    
+    try:
+        parts = [(os.path.join(part_dir, f"part_{index:04d}.pdf"), cards[start:start + part_size])
+                 for index, start in enumerate(range(0, len(cards), part_size))]
+        
+        with stats.stage("pdf_parts"), ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(write_pdf_shard, path, part_cards, subjects, streams) 
+                    for path, part_cards in parts]
             
-            grd_val = grd.add_run(f"{grdvals};  ")
-            grd_val.font.size = Pt(10)
+            for job in jobs:
+                stats.merge(job.result())
+                
+        with stats.stage("merge"):
+            merge_pdf_shards([path for path, _ in parts], filename)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+        
+    return stats.as_dict()
+    
+# Writers for each output backend: (shard writer, merge, file extension)
+
+BACKENDS = {
+    "docx": (write_report_shard, merge_report_cards, ".docx"),
+    "pdf": (write_pdf_shard, merge_pdf_shards, ".pdf"),
+}
+
+def _fixed_card_text():
+    # The text printed the same on every card, so correcting a date or the
+    # grading table writes every shard again
+    return [SCHOOL_CLOSING_DATE, SCHOOL_OPENING_DATE, CLASS_TEACHER_COMMENT, 
+            HEAD_TEACHER_COMMENT, GRADING_SYSTEM]
+    
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, "manifest.json"), encoding="utf-8") as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+        
+def _save_manifest(output_dir, hashes):
+    path = os.path.join(output_dir, "manifest.json")
+    
+    with open(path + ".part", "w", encoding="utf-8") as manifest:
+        json.dump(hashes, manifest, indent=1, sort_keys=True)
+        
+    os.replace(path + ".part", path)
+    
+def print_report_shards(cards, shard_size, output_dir, workers=None, merge=False, 
+                        subjects=SUBJECTS, streams=False, cache=None, backend="docx", stats=None):
+    """
+    Write the report cards as one document per shard_size students,
+    spread over a process pool. Every shard's content hash is kept in
+    output_dir/manifest.json, and shards that are already written with
+    the same content are skipped. Running again after a crash or after
+    correcting a few marks only writes the shards that are missing or
+    have changed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    stats = stats or RunStats()
+    write_shard, merge_shards, extension = BACKENDS[backend]
+    shards = []
+    
+    for index, start in enumerate(range(0, len(cards), shard_size), 1):
+        shard_cards = cards[start:start + shard_size]
+        shard_path = os.path.join(output_dir, _shard_filename(index, shard_cards, shard_size, extension))
+        shard_hash = content_hash("shard", TEMPLATE_VERSION, _fixed_card_text(), subjects, streams, shard_cards)
+        shards.append((shard_path, shard_cards, shard_hash))
+        
+    hashes = _load_manifest(output_dir)
+    
+    pending = [(path, shard_cards, shard_hash) for path, shard_cards, shard_hash in shards 
+               if not os.path.exists(path) or hashes.get(os.path.basename(path)) != shard_hash]
+    
+    print(f" > Writing {len(pending)} of {len(shards)} shards, please wait...")
+    
+    failed = []
+    stats.count("shards_skipped", len(shards) - len(pending))
+    
+    with stats.stage("shards"), ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        jobs = {pool.submit(write_shard, path, shard_cards, subjects, streams, cache): (path, shard_hash) 
+                for path, shard_cards, shard_hash in pending}
+        
+        for job in as_completed(jobs):
+            path, shard_hash = jobs[job]
             
-        form34_run = grd.add_run("FORM 3 & 4 (POINTS): ")
-        form34_run.font.size = Pt(10)
-        form34_run.underline = True
+            try:
+                shard_stats = job.result()
+            except Exception as e:
+                failed.append(path)
+                print(f" > Error writing {path}: {e}")
+                continue
+                
+            stats.merge(shard_stats)
+            hashes[os.path.basename(path)] = shard_hash
+            
+    _save_manifest(output_dir, hashes)
+    
+    if failed:
+        print(f" > {len(failed)} shards failed, run again to retry them...")
+        return None
         
-        for k,v in grading2.items():
-            grdvals = "–".join([str(i) for i in v[0]])
-            grd_key = grd.add_run(f"{k}: ")
-            grd_key.font.size = Pt(10)
-            grd_key.bold = True
+    paths = [path for path, _, _ in shards]
+    
+    if merge and paths:
+        filename = os.path.join(output_dir, f"report_cards{extension}")
+        
+        with stats.stage("merge"):
+            merge_shards(paths, filename)
             
-            grd_val = grd.add_run(f"{grdvals};  ")
-            grd_val.font.size = Pt(10)
+        print(f" > Merged shards into {filename}...")
+        
+    print(" > Report cards generated and saved to storage...")
+    
+    return paths
+    
+def print_report_cards(class_marks, graph_workers=None, shard_size=None, workers=None, 
+                       merge=False, output_dir=None, rank_method="competition", filename=None, 
+                       cache_dir=None, cache_size=256 * 1024 * 1024, backend="docx", stats=None):
+    """
+    Generate the report cards for a class, see load_exams(), as Word
+    documents or, with backend="pdf", as PDFs. By default every card goes
+    into one document, filename; a single PDF has its pages drawn by
+    workers processes, see write_pdf_parallel(). With shard_size set, the cards are
+    written as one document per shard_size students (1 for a file per
+    student) into output_dir by a pool of worker processes, optionally
+    merged at the end. With cache_dir set, progress graphs are kept there
+    (up to cache_size bytes) and reused on the next run. Stage timings
+    and counters are recorded in stats, a RunStats, if given.
+    """
+    subjects = class_marks.subjects
+    cache = CardCache(cache_dir, cache_size) if cache_dir else None
+    stats = stats or RunStats()
+    
+    if rank_method != "competition":
+        # Rank a copy, so the caller's positions are left as they were
+        class_marks = copy.copy(class_marks)
+        
+        with stats.stage("ranking"):
+            class_marks.rank(rank_method)
+        
+    # Stream positions only go on the cards when the class has streams
+    show_streams = any(class_marks.streams)
+    
+    with stats.stage("card_fields"):
+        cards = [(adm, card_fields(class_marks, student), class_marks.progress(student))
+                 for student, adm in enumerate(class_marks.adms)]
+    
+    if shard_size:
+        output_dir = output_dir or f"report_cards_{time.time()}"
+        paths = print_report_shards(cards, shard_size, output_dir, workers, merge, 
+                                    subjects, show_streams, cache, backend, stats)
+        
+        if cache is not None:
+            with stats.stage("cache_evict"):
+                cache.evict()
             
-        #-------------
+        return paths
         
-        doc.add_page_break()
+    filename = filename or f"report_cards_{time.time()}{BACKENDS[backend][2]}"
+    
+    print(" > Generating report cards, please wait...")
+    
+    if backend == "pdf":
+        stats.merge(write_pdf_parallel(filename, cards, subjects, show_streams, workers))
+        print(" > Report cards generated and saved to storage...")
         
-        position += 1
+        return filename
+    
+    ### DOCUMENT WRITER ###
+    
+    doc = new_report_document()
+    
+    # Draw all progress graphs up front so they can be rendered in parallel
+    
+    with stats.stage("graphs"):
+        graphs = render_progress_graphs([progress for _, _, progress in cards], graph_workers, cache, stats)
+    
+    with stats.stage("cards"):
+        template = get_card_template(subjects, show_streams)
         
-    doc.save(filename)
+        for (_, card, _), graph in zip(cards, graphs):
+            template.render(doc, card, graph)
+            
+    with stats.stage("save"):
+        doc.save(filename)
+        
+    stats.count("cards", len(cards))
     
+    if cache is not None:
+        with stats.stage("cache_evict"):
+            cache.evict()
+        
     print(" > Report cards generated and saved to storage...")
     
-    return
+    return filename
+    
+if __name__ == "__main__":
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_exams")
+    
+    parser = argparse.ArgumentParser(description="Generate student report cards from three exams")
+    parser.add_argument("exams", nargs="*", help="opener, midterm and endterm files (CSV or XLSX)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="docx")
+    parser.add_argument("--rank-method", choices=["competition", "dense"], default="competition",
+                        help="how tied students are positioned: 1, 2, 2, 4 (competition) or 1, 2, 2, 3 (dense)")
+    parser.add_argument("--output", help="file for unsharded output (default: report_cards_<time>); "
+                                         "every card is written again on each run")
+    parser.add_argument("--shard-size", type=int, help="write one file per this many cards; "
+                                                       "reruns only write the shards that changed")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--merge", action="store_true", help="merge the shards into one file")
+    parser.add_argument("--output-dir", help="folder for sharded output")
+    parser.add_argument("--cache-dir", default="report_cards_cache", help="graph cache folder")
+    parser.add_argument("--stats", help="write timings and counters to this JSON file")
+    parser.add_argument("--profile", help="write cProfile stats to this file")
+    args = parser.parse_args()
     
-print_report_cards(opener_exams,midterm_exams,endterm_exams)
+    if args.exams and len(args.exams) != 3:
+        parser.error("give all three exam files: opener midterm endterm")
+        
+    exam_files = args.exams or [os.path.join(sample_dir, f"{name.lower()}.csv") for name in EXAM_NAMES]
+    
+    stats = RunStats()
+    
+    with profiled(args.profile):
+        with stats.stage("load"):
+            class_marks = load_exams(*exam_files)
+            
+        print_report_cards(class_marks, graph_workers=args.workers, shard_size=args.shard_size, 
+                           workers=args.workers, merge=args.merge, output_dir=args.output_dir, 
+                           rank_method=args.rank_method, filename=args.output, cache_dir=args.cache_dir, 
+                           backend=args.backend, stats=stats)
+        
+    if args.stats:
+        stats.write(args.stats)
@@ -2,30 +2,287 @@
 # · The StudentManager class handles all database operations
 # · It connects to MongoDB running on localhost:27017 (type "mongod" on terminal to start the server)
 # · It uses a database named tumaini with a collection named students
+# · Admission numbers are kept unique by an index created at startup
+# · find_student can be served from an in-process cache (StudentManager(cache_size=..., cache_ttl=...))
+# · AsyncStudentManager offers the same operations for asyncio front-ends (pymongo's async API)
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from collections import OrderedDict
+from itertools import islice
+import asyncio
+import random
+import time
+import json
+import csv
 import sys
+import os
+
+try:
+    from pymongo import AsyncMongoClient  # pymongo 4.9+, the successor of Motor
+except ImportError:
+    AsyncMongoClient = None
+
+
+STUDENT_FIELDS = ["adm", "name", "gender", "yob", "dorm"]
+# Indexed fields students can be listed in order of
+SORT_FIELDS = ["adm", "dorm", "yob", "gender"]
+# Fields returned when listing students (MongoDB's _id is left out)
+STUDENT_PROJECTION = {"_id": 0, **{field: 1 for field in STUDENT_FIELDS}}
+
+DUPLICATE_ADM_MESSAGE = "Student with admission number {adm} already exists."
+NOT_UNIQUE_ADM_MESSAGE = "Admission number {adm} is not unique."
+
+
+def validate_student(name, adm, gender, yob, dorm):
+    """Return the error message for invalid student details, or None if they are valid"""
+    if not all([name, adm, gender, yob, dorm]):
+        return "All fields are required!"
+    
+    if gender not in ['M', 'F']:
+        return "Gender must be M or F!"
+    
+    if len(yob) != 4 or not yob.isdigit():
+        return "Year of birth must be a 4-digit number!"
+    
+    return None
+
+
+def clean_student(record):
+    """Student fields of a record read from a file, as stripped strings (gender upper case)"""
+    student = {field: str(record.get(field) or "").strip() for field in STUDENT_FIELDS}
+    student["gender"] = student["gender"].upper()
+    return student
+
+
+class InvalidRecord(ValueError):
+    """Yielded by read_records in place of a line that is not a JSON object, so the bulk
+    methods report it as that record's error and carry on with the rest"""
+
+
+def read_records(source):
+    """Yield records from a .csv or .jsonl file path, or from any iterable of dicts
+    
+    CSV headers are matched case-insensitively (ADM or adm), and the byte order mark
+    Excel puts at the start of "CSV UTF-8" files is skipped. Unreadable JSON lines are
+    yielded as InvalidRecord errors."""
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    
+    with open(source, newline='', encoding='utf-8-sig') as records_file:
+        if str(source).lower().endswith('.csv'):
+            reader = csv.DictReader(records_file)
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+            yield from reader
+        else:
+            for line_number, line in enumerate(records_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield InvalidRecord(f"Invalid JSON on line {line_number}: {e.msg}.")
+                    continue
+                if not isinstance(record, dict):
+                    yield InvalidRecord(f"Line {line_number} is not a JSON object.")
+                    continue
+                yield record
+
+
+def batched(records, batch_size):
+    """Yield lists of up to batch_size (record number, record) pairs, numbered from 1"""
+    numbered = enumerate(records, 1)
+    while batch := list(islice(numbered, batch_size)):
+        yield batch
+
+
+def unreadable(number, record, errors):
+    """Report a record that could not be read (or is not a dict) and return True, else False"""
+    if isinstance(record, dict):
+        return False
+    message = str(record) if isinstance(record, InvalidRecord) else "Record is not an object."
+    errors.append({"record": number, "adm": "", "error": message})
+    return True
+
+
+def valid_students(batch, errors):
+    """Clean and validate a batch of (record number, record), reporting invalid records in errors"""
+    valid = []
+    for number, record in batch:
+        if unreadable(number, record, errors):
+            continue
+        student = clean_student(record)
+        if message := validate_student(**student):
+            errors.append({"record": number, "adm": student["adm"], "error": message})
+        else:
+            valid.append((number, student))
+    return valid
+
+
+def write_error_reports(error, batch, message):
+    """Per-record error reports of a BulkWriteError raised for a batch of (record number, student);
+    duplicate admission numbers get `message`"""
+    errors = []
+    for write_error in error.details.get("writeErrors", []):
+        number, student = batch[write_error["index"]]
+        if write_error.get("code") == 11000:
+            text = message.format(adm=student["adm"])
+        else:
+            text = write_error.get("errmsg", "Write failed.")
+        errors.append({"record": number, "adm": student["adm"], "error": text})
+    return errors
+
+
+def upsert_requests(batch):
+    """bulk_write requests adding or updating each student of a batch, matched on adm"""
+    return [UpdateOne({"adm": student["adm"]}, {"$set": student}, upsert=True)
+            for _, student in batch]
+
+
+def delete_adms(batch, errors):
+    """Admission numbers of a batch of delete records, mapped to their record numbers"""
+    adms = {}
+    for number, record in batch:
+        if unreadable(number, record, errors):
+            continue
+        adm = str(record.get("adm") or "").strip()
+        if adm:
+            adms.setdefault(adm, number)
+        else:
+            errors.append({"record": number, "adm": adm, "error": "Admission number is required!"})
+    return adms
+
+
+def report_missing(adms, found, errors):
+    """Report the admission numbers of a delete batch that are not in the database"""
+    for adm, number in adms.items():
+        if adm not in found:
+            errors.append({"record": number, "adm": adm, "error": "Student not found."})
+
+
+def page_query(sort_field, after):
+    """Query and sort order of the page of students that follows key `after`
+    
+    Pages are found by key (range) rather than skip/limit, so each page costs the same
+    however deep into the list it is. Ties on the sort field are ordered by adm, the
+    second key of the field's index."""
+    if sort_field not in SORT_FIELDS:
+        raise ValueError(f"Students can only be sorted by {', '.join(SORT_FIELDS)}")
+    
+    query = {}
+    if after is not None:
+        value, adm = after
+        if sort_field == "adm":
+            query = {"adm": {"$gt": adm}}
+        else:
+            query = {"$or": [{sort_field: {"$gt": value}},
+                             {sort_field: value, "adm": {"$gt": adm}}]}
+    
+    sort = [("adm", 1)] if sort_field == "adm" else [(sort_field, 1), ("adm", 1)]
+    return query, sort
+
+
+def page_result(students, page_size, sort_field):
+    """Split the page_size + 1 students read for a page into (students, next_after)"""
+    if len(students) <= page_size:
+        return students, None
+    students = students[:page_size]
+    last = students[-1]
+    return students, (last.get(sort_field), last["adm"])
+
+
+class StudentCache:
+    """Least recently used cache of find_student results, each kept for `ttl` seconds
+    
+    Students not found are cached too (as None). Changes made by other processes show up
+    once an entry expires; the manager owning the cache invalidates entries on its own
+    writes. `hits` and `misses` count lookups served from the cache and from the database."""
+    
+    MISSING = object()  # get() result when the database must be asked
+    
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # adm -> (expiry time, student or None)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, adm):
+        """Cached student (or None if known to be missing), else StudentCache.MISSING"""
+        entry = self.entries.get(adm)
+        if entry is not None:
+            expires, student = entry
+            if expires > time.monotonic():
+                self.entries.move_to_end(adm)
+                self.hits += 1
+                return student
+            del self.entries[adm]
+        self.misses += 1
+        return StudentCache.MISSING
+    
+    def put(self, adm, student):
+        """Remember what the database returned for adm, dropping the least recently used entry if full"""
+        self.entries[adm] = (time.monotonic() + self.ttl, student)
+        self.entries.move_to_end(adm)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, adm):
+        self.entries.pop(adm, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self):
+        """Hit and miss counts, hit rate and number of cached students"""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries)}
 
 
 class StudentManager:
     """A class to manage student records in a MongoDB database"""
     
-    def __init__(self):
-        """Initialize the database connection"""
+    def __init__(self, cache_size=0, cache_ttl=60.0):
+        """Initialize the database connection
+        
+        With cache_size > 0, find_student keeps up to that many students in memory for
+        cache_ttl seconds (see StudentCache), so repeated lookups skip the database."""
+        self.cache = StudentCache(cache_size, cache_ttl) if cache_size > 0 else None
         try:
             self.client = MongoClient('localhost', 27017)
             self.db = self.client.tumaini
             self.student_collection = self.db.students
+            self.ensure_indexes()
             print("Database connection established successfully.")
         except Exception as e:
             print(f"Error connecting to database: {e}")
             sys.exit(1)
     
+    def ensure_indexes(self):
+        """Create the collection's indexes (does nothing if they already exist)"""
+        # Unique index on adm: lookups by admission number use it and the database
+        # itself rejects a second student with the same admission number. Without it
+        # (e.g. existing duplicates) new students are checked for duplicates before inserting.
+        try:
+            self.student_collection.create_index("adm", unique=True)
+            self._adm_unique = True
+        except OperationFailure as e:
+            self._adm_unique = False
+            print(f"Warning: could not create unique index on adm (duplicate admission numbers?): {e}")
+            print("Admission numbers will be checked before each insert until the duplicates are removed.")
+        
+        # Secondary indexes for filtering and paged listing; adm comes second so a page
+        # sorted on (field, adm) is read straight from the index
+        for field in SORT_FIELDS[1:]:
+            self.student_collection.create_index([(field, 1), ("adm", 1)])
+    
     def add_student(self, name, adm, gender, yob, dorm):
         """Add a new student to the database"""
-        # Check if student with this admission number already exists
-        if self.student_collection.find_one({"adm": adm}):
-            return False, f"Student with admission number {adm} already exists."
+        if error := validate_student(name, adm, gender, yob, dorm):
+            return False, error
         
         # Create student data dictionary
         student_data = {
@@ -36,8 +293,18 @@ class StudentManager:
             "dorm": dorm
         }
         
-        # Insert the student into the database
-        result = self.student_collection.insert_one(student_data)
+        # Check if student with same admission number already exists, when there is
+        # no unique index to do it
+        if not self._adm_unique and self.student_collection.find_one({"adm": adm}, {"_id": 1}):
+            return False, DUPLICATE_ADM_MESSAGE.format(adm=adm)
+        
+        # Insert the student into the database, the unique index on adm rejects duplicates
+        try:
+            result = self.student_collection.insert_one(student_data)
+        except DuplicateKeyError:
+            return False, DUPLICATE_ADM_MESSAGE.format(adm=adm)
+        finally:
+            self._invalidate(adm)
         
         if result.inserted_id:
             return True, f"Student {name} added successfully with admission number {adm}."
@@ -46,15 +313,35 @@ class StudentManager:
     
     def find_student(self, adm):
         """Find a student by admission number"""
-        student = self.student_collection.find_one({"adm": adm})
-        return student
+        if self.cache is None:
+            return self.student_collection.find_one({"adm": adm})
+        
+        student = self.cache.get(adm)
+        if student is StudentCache.MISSING:
+            student = self.student_collection.find_one({"adm": adm})
+            self.cache.put(adm, student)
+        # A copy, so callers changing the student do not change the cached one
+        return dict(student) if student is not None else None
+    
+    def _invalidate(self, adm):
+        """Drop a student from the find_student cache after this process writes it"""
+        if self.cache is not None:
+            self.cache.invalidate(adm)
+    
+    def cache_stats(self):
+        """find_student cache hits, misses, hit rate and size (None if caching is off)"""
+        return self.cache.stats() if self.cache is not None else None
     
     def update_student(self, adm, name, gender, yob, dorm):
         """Update a student's information"""
+        if error := validate_student(name, adm, gender, yob, dorm):
+            return False, error
+        
         result = self.student_collection.update_one(
             {"adm": adm}, 
             {"$set": {"name": name, "gender": gender, "yob": yob, "dorm": dorm}}
         )
+        self._invalidate(adm)
         
         if result.modified_count > 0:
             return True, "Student information updated successfully."
@@ -64,28 +351,335 @@ class StudentManager:
     def delete_student(self, adm):
         """Delete a student from the database"""
         result = self.student_collection.delete_one({"adm": adm})
+        self._invalidate(adm)
         
         if result.deleted_count > 0:
             return True, "Student deleted successfully."
         else:
             return False, "Student not found."
     
-    def get_all_students(self):
-        """Retrieve all students from the database"""
-        return self.student_collection.find()
+    def get_all_students(self, batch_size=500):
+        """Retrieve all students from the database, sorted by admission number, as a cursor
+        fetching batch_size students per round trip"""
+        return (self.student_collection.find({}, STUDENT_PROJECTION)
+                .sort("adm", 1)
+                .batch_size(batch_size))
+    
+    def list_students(self, page_size=20, after=None, sort_field="adm", batch_size=None):
+        """Return one page of students sorted on an indexed field
+        
+        `after` is the key returned with the previous page (None for the first, see
+        page_query). Returns (students, next_after), next_after being None on the last page."""
+        query, sort = page_query(sort_field, after)
+        # One extra student tells whether another page follows
+        cursor = (self.student_collection.find(query, STUDENT_PROJECTION)
+                  .sort(sort)
+                  .limit(page_size + 1)
+                  .batch_size(batch_size or page_size + 1))
+        return page_result(list(cursor), page_size, sort_field)
+    
+    def count_students(self):
+        """Approximate number of students, from collection metadata rather than a scan"""
+        return self.student_collection.estimated_document_count()
+    
+    def bulk_add(self, source, batch_size=1000):
+        """Add many students from a .csv/.jsonl file or an iterable of dicts
+        
+        Records are inserted in batches with insert_many(ordered=False), so one bad record
+        does not stop the rest of its batch. Returns (number added, errors) where each error
+        is {"record": record number, "adm": ..., "error": message}."""
+        added = 0
+        errors = []
+        for batch in batched(read_records(source), batch_size):
+            batch = valid_students(batch, errors)
+            if not self._adm_unique:
+                batch = self._new_students(batch, errors)
+            if not batch:
+                continue
+            try:
+                result = self.student_collection.insert_many([student for _, student in batch], ordered=False)
+                added += len(result.inserted_ids)
+            except BulkWriteError as e:
+                added += e.details.get("nInserted", 0)
+                errors.extend(write_error_reports(e, batch, DUPLICATE_ADM_MESSAGE))
+            finally:
+                for _, student in batch:
+                    self._invalidate(student["adm"])
+        errors.sort(key=lambda error: error["record"])
+        return added, errors
+    
+    def _new_students(self, batch, errors):
+        """Drop the students of a batch whose admission number is already taken, in the
+        database or earlier in the batch (only needed without the unique index on adm)"""
+        adms = [student["adm"] for _, student in batch]
+        taken = {student["adm"] for student in
+                 self.student_collection.find({"adm": {"$in": adms}}, {"adm": 1, "_id": 0})}
+        new = []
+        for number, student in batch:
+            if student["adm"] in taken:
+                errors.append({"record": number, "adm": student["adm"],
+                               "error": DUPLICATE_ADM_MESSAGE.format(adm=student["adm"])})
+            else:
+                taken.add(student["adm"])
+                new.append((number, student))
+        return new
+    
+    def bulk_upsert(self, source, batch_size=1000):
+        """Add or update many students, matched on admission number, from a .csv/.jsonl file
+        or an iterable of dicts, in unordered bulk_write batches
+        
+        Returns (number added or updated, errors) like bulk_add."""
+        written = 0
+        errors = []
+        for batch in batched(read_records(source), batch_size):
+            batch = valid_students(batch, errors)
+            if not batch:
+                continue
+            try:
+                result = self.student_collection.bulk_write(upsert_requests(batch), ordered=False)
+                written += result.matched_count + result.upserted_count
+            except BulkWriteError as e:
+                written += e.details.get("nMatched", 0) + e.details.get("nUpserted", 0)
+                errors.extend(write_error_reports(e, batch, NOT_UNIQUE_ADM_MESSAGE))
+            finally:
+                for _, student in batch:
+                    self._invalidate(student["adm"])
+        errors.sort(key=lambda error: error["record"])
+        return written, errors
+    
+    def bulk_delete(self, source, batch_size=1000):
+        """Delete many students by admission number, from a .csv/.jsonl file (an adm column
+        or field) or an iterable of dicts, one delete_many per batch
+        
+        Returns (number deleted, errors) like bulk_add; unknown admission numbers are errors."""
+        deleted = 0
+        errors = []
+        for batch in batched(read_records(source), batch_size):
+            adms = delete_adms(batch, errors)
+            if not adms:
+                continue
+            
+            found = {student["adm"] for student in
+                     self.student_collection.find({"adm": {"$in": list(adms)}}, {"adm": 1, "_id": 0})}
+            report_missing(adms, found, errors)
+            
+            result = self.student_collection.delete_many({"adm": {"$in": list(found)}})
+            deleted += result.deleted_count
+            for adm in adms:
+                self._invalidate(adm)
+        errors.sort(key=lambda error: error["record"])
+        return deleted, errors
+    
+    def export_students(self, path, batch_size=1000):
+        """Write every student to a .csv or .jsonl file, streaming from the cursor in
+        batches sorted by admission number; returns the number of students written"""
+        cursor = (self.student_collection.find({}, STUDENT_PROJECTION)
+                  .sort("adm", 1)
+                  .batch_size(batch_size))
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as export_file:
+            if str(path).lower().endswith('.csv'):
+                writer = csv.DictWriter(export_file, fieldnames=STUDENT_FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                for student in cursor:
+                    writer.writerow(student)
+                    count += 1
+            else:
+                for student in cursor:
+                    export_file.write(json.dumps(student) + "\n")
+                    count += 1
+        return count
     
     def close_connection(self):
         """Close the database connection"""
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print(f"Lookup cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
         self.client.close()
         print("Database connection closed.")
 
 
+class AsyncStudentManager:
+    """An asyncio version of StudentManager, for front-ends serving many requests at once
+    
+    It has the same methods (awaited) and shares validation, paging and bulk error handling
+    with StudentManager; bulk operations run several batches concurrently. Create it with
+    `manager = await AsyncStudentManager.connect()`. Errors are raised rather than ending
+    the program, since a server should keep running."""
+    
+    def __init__(self, client=None):
+        """Set up the client (connections are opened on first use)"""
+        if client is None:
+            if AsyncMongoClient is None:
+                raise RuntimeError("AsyncStudentManager needs pymongo 4.9 or newer (pip install -U pymongo)")
+            client = AsyncMongoClient('localhost', 27017)
+        self.client = client
+        self.db = self.client.tumaini
+        self.student_collection = self.db.students
+    
+    @classmethod
+    async def connect(cls, client=None):
+        """Create a manager and make sure the collection's indexes exist"""
+        manager = cls(client)
+        await manager.ensure_indexes()
+        return manager
+    
+    async def ensure_indexes(self):
+        """Create the same indexes as StudentManager.ensure_indexes"""
+        await self.student_collection.create_index("adm", unique=True)
+        for field in SORT_FIELDS[1:]:
+            await self.student_collection.create_index([(field, 1), ("adm", 1)])
+    
+    async def add_student(self, name, adm, gender, yob, dorm):
+        """Add a new student to the database"""
+        if error := validate_student(name, adm, gender, yob, dorm):
+            return False, error
+        
+        student_data = {"adm": adm, "name": name, "gender": gender, "yob": yob, "dorm": dorm}
+        try:
+            await self.student_collection.insert_one(student_data)
+        except DuplicateKeyError:
+            return False, DUPLICATE_ADM_MESSAGE.format(adm=adm)
+        return True, f"Student {name} added successfully with admission number {adm}."
+    
+    async def find_student(self, adm):
+        """Find a student by admission number"""
+        return await self.student_collection.find_one({"adm": adm})
+    
+    async def update_student(self, adm, name, gender, yob, dorm):
+        """Update a student's information"""
+        if error := validate_student(name, adm, gender, yob, dorm):
+            return False, error
+        
+        result = await self.student_collection.update_one(
+            {"adm": adm},
+            {"$set": {"name": name, "gender": gender, "yob": yob, "dorm": dorm}}
+        )
+        if result.modified_count > 0:
+            return True, "Student information updated successfully."
+        return False, "No changes made or student not found."
+    
+    async def delete_student(self, adm):
+        """Delete a student from the database"""
+        result = await self.student_collection.delete_one({"adm": adm})
+        if result.deleted_count > 0:
+            return True, "Student deleted successfully."
+        return False, "Student not found."
+    
+    def get_all_students(self, batch_size=500):
+        """All students sorted by admission number, as an async cursor (use `async for`)"""
+        return (self.student_collection.find({}, STUDENT_PROJECTION)
+                .sort("adm", 1)
+                .batch_size(batch_size))
+    
+    async def list_students(self, page_size=20, after=None, sort_field="adm", batch_size=None):
+        """Return one page of students and the key of the next, like StudentManager.list_students"""
+        query, sort = page_query(sort_field, after)
+        cursor = (self.student_collection.find(query, STUDENT_PROJECTION)
+                  .sort(sort)
+                  .limit(page_size + 1)
+                  .batch_size(batch_size or page_size + 1))
+        return page_result(await cursor.to_list(None), page_size, sort_field)
+    
+    async def count_students(self):
+        """Approximate number of students, from collection metadata rather than a scan"""
+        return await self.student_collection.estimated_document_count()
+    
+    async def _run_batches(self, source, batch_size, concurrency, write_batch):
+        """Read batches from source and run `await write_batch(batch, errors)` on them, with up
+        to `concurrency` batches in flight; returns (sum of their counts, sorted errors)"""
+        errors = []
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(batch):
+            try:
+                return await write_batch(batch, errors)
+            finally:
+                semaphore.release()
+        
+        tasks = []
+        for batch in batched(read_records(source), batch_size):
+            # Only read the next batch once one is free to run, so files are streamed
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(batch)))
+        counts = await asyncio.gather(*tasks)
+        
+        errors.sort(key=lambda error: error["record"])
+        return sum(counts), errors
+    
+    async def _add_batch(self, batch, errors):
+        batch = valid_students(batch, errors)
+        if not batch:
+            return 0
+        try:
+            result = await self.student_collection.insert_many([student for _, student in batch], ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors.extend(write_error_reports(e, batch, DUPLICATE_ADM_MESSAGE))
+            return e.details.get("nInserted", 0)
+    
+    async def _upsert_batch(self, batch, errors):
+        batch = valid_students(batch, errors)
+        if not batch:
+            return 0
+        try:
+            result = await self.student_collection.bulk_write(upsert_requests(batch), ordered=False)
+            return result.matched_count + result.upserted_count
+        except BulkWriteError as e:
+            errors.extend(write_error_reports(e, batch, NOT_UNIQUE_ADM_MESSAGE))
+            return e.details.get("nMatched", 0) + e.details.get("nUpserted", 0)
+    
+    async def _delete_batch(self, batch, errors):
+        adms = delete_adms(batch, errors)
+        if not adms:
+            return 0
+        cursor = self.student_collection.find({"adm": {"$in": list(adms)}}, {"adm": 1, "_id": 0})
+        found = {student["adm"] for student in await cursor.to_list(None)}
+        report_missing(adms, found, errors)
+        result = await self.student_collection.delete_many({"adm": {"$in": list(found)}})
+        return result.deleted_count
+    
+    async def bulk_add(self, source, batch_size=1000, concurrency=4):
+        """Add many students like StudentManager.bulk_add, `concurrency` batches at a time"""
+        return await self._run_batches(source, batch_size, concurrency, self._add_batch)
+    
+    async def bulk_upsert(self, source, batch_size=1000, concurrency=4):
+        """Add or update many students like StudentManager.bulk_upsert, `concurrency` batches at a time"""
+        return await self._run_batches(source, batch_size, concurrency, self._upsert_batch)
+    
+    async def bulk_delete(self, source, batch_size=1000, concurrency=4):
+        """Delete many students like StudentManager.bulk_delete, `concurrency` batches at a time"""
+        return await self._run_batches(source, batch_size, concurrency, self._delete_batch)
+    
+    async def close_connection(self):
+        """Close the database connection"""
+        await self.client.close()
+
+
+async def benchmark_lookups(manager, requests=2000, concurrency=100):
+    """Measure find_student requests per second of an AsyncStudentManager, running up to
+    `concurrency` lookups at once over admission numbers from the first page of students"""
+    students, _ = await manager.list_students(page_size=1000)
+    if not students:
+        return 0.0
+    adms = [student["adm"] for student in students]
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def lookup():
+        async with semaphore:
+            await manager.find_student(random.choice(adms))
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(lookup() for _ in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
 class StudentManagementSystem:
     """A class to handle the user interface for student management"""
     
     def __init__(self):
-        """Initialize the student manager"""
-        self.manager = StudentManager()
+        """Initialize the student manager (desks look up the same students often, so lookups are cached)"""
+        self.manager = StudentManager(cache_size=1024, cache_ttl=60.0)
     
     def display_menu(self):
         """Display the main menu"""
@@ -112,16 +706,8 @@ class StudentManagementSystem:
         dorm = input("Enter dorm/hostel: ").strip()
         
         # Validate input
-        if not all([name, adm, gender, yob, dorm]):
-            print("Error: All fields are required!")
-            return
-        
-        if gender not in ['M', 'F']:
-            print("Error: Gender must be M or F!")
-            return
-        
-        if len(yob) != 4 or not yob.isdigit():
-            print("Error: Year of birth must be a 4-digit number!")
+        if error := validate_student(name, adm, gender, yob, dorm):
+            print(f"Error: {error}")
             return
         
         # Add student to database
@@ -176,12 +762,8 @@ class StudentManagementSystem:
         dorm = input(f"Dorm/Hostel [{student['dorm']}]: ").strip() or student['dorm']
         
         # Validate input
-        if gender not in ['M', 'F']:
-            print("Error: Gender must be M or F!")
-            return
-        
-        if len(yob) != 4 or not yob.isdigit():
-            print("Error: Year of birth must be a 4-digit number!")
+        if error := validate_student(name, adm, gender, yob, dorm):
+            print(f"Error: {error}")
             return
         
         # Update student
@@ -212,25 +794,40 @@ class StudentManagementSystem:
         else:
             print("Deletion cancelled.")
     
-    def display_all_students_ui(self):
-        """User interface for displaying all students"""
+    def display_all_students_ui(self, page_size=20):
+        """User interface for displaying all students, one page at a time"""
         print("\n--- All Students ---")
         
-        students = self.manager.get_all_students()
+        sort_field = input(f"Sort by ({'/'.join(SORT_FIELDS)}) [adm]: ").strip().lower() or "adm"
+        if sort_field not in SORT_FIELDS:
+            print(f"Error: Sort field must be one of {', '.join(SORT_FIELDS)}!")
+            return
+        
+        total = self.manager.count_students()
+        after = None
         count = 0
         
-        for student in students:
-            count += 1
-            print(f"\nStudent #{count}:")
-            print("-" * 15)
-            for key, value in student.items():
-                if key != "_id":  # Skip MongoDB's internal ID
-                    print(f"{key.capitalize()}: {value}")
+        while True:
+            students, after = self.manager.list_students(page_size, after, sort_field)
+            if not students:
+                break
+            
+            print(f"\n{'NO.':<6} {'ADM':<12} {'NAME':<30} {'GENDER':<7} {'YOB':<5} DORM")
+            print("-" * 75)
+            for student in students:
+                count += 1
+                print(f"{count:<6} {student.get('adm', ''):<12} {student.get('name', ''):<30} "
+                      f"{student.get('gender', ''):<7} {student.get('yob', ''):<5} {student.get('dorm', '')}")
+            print(f"\nShowing {count - len(students) + 1}-{count} of about {total} students")
+            
+            if after is None:
+                break
+            more = input("Press Enter for the next page or q to stop: ").strip().lower()
+            if more == 'q':
+                break
         
         if count == 0:
             print("No students found in the database.")
-        else:
-            print(f"\nTotal students: {count}")
     
     def run(self):
         """Main method to run the student management system"""
@@ -260,7 +857,21 @@ class StudentManagementSystem:
             input("\nPress Enter to continue...")
 
 
-# Start the program
+async def run_benchmark():
+    """Print async find_student throughput against the local database"""
+    manager = await AsyncStudentManager.connect()
+    try:
+        for concurrency in (1, 10, 100):
+            rate = await benchmark_lookups(manager, concurrency=concurrency)
+            print(f"find_student, {concurrency} concurrent: {rate:.0f} requests/second")
+    finally:
+        await manager.close_connection()
+
+
+# Start the program (--benchmark measures AsyncStudentManager lookups instead)
 if __name__ == "__main__":
-    system = StudentManagementSystem()
-    system.run()
\ No newline at end of file
+    if "--benchmark" in sys.argv[1:]:
+        asyncio.run(run_benchmark())
+    else:
+        system = StudentManagementSystem()
+        system.run()
\ No newline at end of file
@@ -5,62 +5,283 @@ and missing telephone information, generating comprehensive reports.
 
 import os
 import re
+import csv
 import docx
+import json
+import random
+import sqlite3
+import numpy as np
+from functools import lru_cache
+from itertools import groupby
+from difflib import SequenceMatcher
 from pathlib import Path
-from collections import defaultdict, deque
+from collections import defaultdict
+from school_filenames import parse_school_filename
+from school_scan_cache import ScanCache
+
+# Soundex digit of each letter: vowels (and Y) separate codes as 0, H and W are dropped
+SOUNDEX_TABLE = str.maketrans("AEIOUYBFPVCGJKQSXZDTLMNR", "000000111122222222334556", "HW")
+
+
+@lru_cache(maxsize=1 << 16)
+def soundex(word):
+    """Four character Soundex code of a word (e.g. ABDI and ABDY are both A130)"""
+    word = "".join(filter(str.isalpha, word.upper()))
+    if not word:
+        return ""
+    digits = word.translate(SOUNDEX_TABLE)
+    if word[0] in "HW":
+        digits = "0" + digits  # Keeps the first letter's place, it has no digit of its own
+    digits = "".join(digit for digit, _ in groupby(digits))[1:].replace("0", "")
+    return (word[0] + digits + "000")[:4]
+
+
+class FuzzyNameMatcher:
+    """Finds pairs of different names that are probably the same pupil
+    
+    Comparing every pair of 200k names is far too slow, so names are first put into
+    blocks that share a key and only names sharing a block are scored:
+      - the name's tokens sorted, catching swapped name order,
+      - the sorted Soundex codes of its tokens, catching spelling variants (ABDI/ABDY),
+      - MinHash/LSH bands over character 3-grams, catching OCR and typing errors.
+    Candidates are scored with difflib's ratio and kept at or above the threshold."""
+    
+    PRIME = (1 << 31) - 1
+    
+    def __init__(self, threshold=0.85, num_perm=32, bands=8, max_block_size=200, seed=1):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Blocks bigger than this (e.g. very common names) are skipped, other keys still apply
+        self.max_block_size = max_block_size
+        rng = random.Random(seed)
+        self.hash_a = np.array([rng.randrange(1, self.PRIME) for _ in range(num_perm)], dtype=np.int64)
+        self.hash_b = np.array([rng.randrange(0, self.PRIME) for _ in range(num_perm)], dtype=np.int64)
+    
+    def minhash_signatures(self, keys):
+        """MinHash signature of the character 3-grams of each key, as a (num_perm, len(keys)) array"""
+        padded = [f" {key} ".encode() for key in keys]
+        lengths = np.array([len(key) for key in padded], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        
+        # Every 3 consecutive bytes of all keys as one integer, dropping the 3-grams that
+        # run from one key into the next; each key then has len - 2 grams
+        text = np.frombuffer(b"".join(padded), dtype=np.uint8).astype(np.int64)
+        grams = (text[:-2] << 16) | (text[1:-1] << 8) | text[2:]
+        crossing = np.concatenate([ends[:-1] - 2, ends[:-1] - 1])
+        grams = np.delete(grams, crossing)
+        offsets = ends - lengths - 2 * np.arange(len(keys))
+        
+        signatures = np.empty((len(self.hash_a), len(keys)), dtype=np.int64)
+        for i, (a, b) in enumerate(zip(self.hash_a, self.hash_b)):
+            signatures[i] = np.minimum.reduceat((a * grams + b) % self.PRIME, offsets)
+        return signatures
+    
+    def _add_block_pairs(self, pairs, members):
+        """Add every pair of a block's members, unless the block is too big to be useful"""
+        if 1 < len(members) <= self.max_block_size:
+            members = sorted(members)
+            for x, i in enumerate(members):
+                for j in members[x + 1:]:
+                    pairs.add((i, j))
+    
+    def candidate_pairs(self, names):
+        """Index pairs (i, j), i < j, of names sharing at least one block"""
+        sorted_keys = [" ".join(sorted(name.split())) for name in names]
+        blocks = defaultdict(list)
+        for i, (name, key) in enumerate(zip(names, sorted_keys)):
+            blocks[("sorted", key)].append(i)
+            blocks[("soundex", " ".join(sorted(map(soundex, name.split()))))].append(i)
+        
+        pairs = set()
+        for members in blocks.values():
+            self._add_block_pairs(pairs, members)
+        
+        # LSH: names whose signatures agree on all rows of a band share that band's block.
+        # The rows of a band are mixed into one 64-bit key and grouped with numpy, so only
+        # blocks holding several names reach Python.
+        signatures = self.minhash_signatures(sorted_keys).astype(np.uint64)
+        for band in range(self.bands):
+            band_keys = np.zeros(len(names), dtype=np.uint64)
+            for row in signatures[band * self.rows:(band + 1) * self.rows]:
+                band_keys = band_keys * np.uint64(0x9E3779B97F4A7C15) + row
+            order = np.argsort(band_keys, kind="stable")
+            band_keys = band_keys[order]
+            starts = np.flatnonzero(np.diff(band_keys, prepend=band_keys[:1] + np.uint64(1)))
+            sizes = np.diff(starts, append=len(band_keys))
+            shared = sizes > 1
+            for start, size in zip(starts[shared].tolist(), sizes[shared].tolist()):
+                self._add_block_pairs(pairs, order[start:start + size].tolist())
+        return pairs, sorted_keys
+    
+    def similarity(self, name_a, name_b, sorted_a, sorted_b, at_least=0.0):
+        """Similarity of two names between 0 and 1, ignoring the order of their tokens
+        
+        Comparisons whose cheap upper bounds are already below `at_least` are skipped
+        and count as 0."""
+        best = 0.0
+        for a, b in ((name_a, name_b), (sorted_a, sorted_b)):
+            matcher = SequenceMatcher(None, a, b)
+            if matcher.real_quick_ratio() >= at_least and matcher.quick_ratio() >= at_least:
+                best = max(best, matcher.ratio())
+        return best
+    
+    def match(self, names):
+        """Return [(similarity, name_a, name_b), ...] for distinct names at or above the
+        threshold, most similar first"""
+        names = sorted(set(names))
+        if len(names) < 2:
+            return []
+        pairs, sorted_keys = self.candidate_pairs(names)
+        
+        matches = []
+        for i, j in pairs:
+            score = self.similarity(names[i], names[j], sorted_keys[i], sorted_keys[j], self.threshold)
+            if score >= self.threshold:
+                matches.append((round(score, 3), names[i], names[j]))
+        matches.sort(key=lambda match: (-match[0], match[1], match[2]))
+        return matches
+
+def read_results(results_path):
+    """Yield the analysis records saved by a ResultSink, in the order they were written
+    
+    A last record cut short by a run that died while writing it is skipped."""
+    results_path = Path(results_path)
+    if not results_path.exists():
+        return
+    with open(results_path, newline='', encoding='utf-8') as results_file:
+        if results_path.suffix.lower() == '.csv':
+            for row in csv.DictReader(results_file):
+                try:
+                    yield ResultSink.from_csv_row(row)
+                except (ValueError, TypeError):
+                    continue
+        else:
+            for line in results_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class ResultSink:
+    """Streams analysis records to a JSON Lines (.jsonl) or CSV (.csv) file, one per document
+    
+    Records are written as soon as a document is analyzed and flushed every `flush_every`
+    records, so a run that dies halfway keeps what it has done. Opening an existing file
+    resumes it: records of documents that still exist with the same size and mtime are
+    kept (and those documents can be skipped), the rest are dropped. Records of documents
+    that could not be read (those with an 'error') are dropped too, so they are retried."""
+    
+    CSV_FIELDS = ['filename', 'size', 'mtime_ns', 'school_code', 'student_count', 'has_telephone',
+                  'student_duplicates', 'code_mismatches', 'names', 'name_paragraphs', 'error']
+    # Columns holding lists, stored as JSON inside the CSV cell
+    CSV_JSON_FIELDS = {'student_duplicates', 'code_mismatches', 'names', 'name_paragraphs'}
+    
+    def __init__(self, results_path, directory_path, flush_every=10):
+        self.path = Path(results_path)
+        self.directory = Path(directory_path)
+        self.is_csv = self.path.suffix.lower() == '.csv'
+        self.flush_every = flush_every
+        self.done = {}
+        self.count = 0
+        self._unflushed = 0
+        
+        # Rewrite the file with the records that are still valid, then append to it
+        kept = [record for record in read_results(self.path) if self._unchanged(record)]
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, 'w', newline='', encoding='utf-8') as temp_file:
+            self._open_writer(temp_file, header=True)
+            for record in kept:
+                self._write(record)
+        os.replace(temp_path, self.path)
+        
+        self.file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._open_writer(self.file, header=False)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _open_writer(self, results_file, header):
+        self._file = results_file
+        if self.is_csv:
+            self._csv_writer = csv.DictWriter(results_file, fieldnames=self.CSV_FIELDS, extrasaction='ignore')
+            if header:
+                self._csv_writer.writeheader()
+    
+    def _unchanged(self, record):
+        if record.get('error'):
+            return False
+        doc_path = self.directory / record.get('filename', '')
+        try:
+            return ScanCache.stamp(doc_path) == (record['size'], record['mtime_ns'])
+        except (OSError, KeyError):
+            return False
+    
+    def _write(self, record):
+        if self.is_csv:
+            self._csv_writer.writerow({field: json.dumps(value) if field in self.CSV_JSON_FIELDS else value
+                                      for field, value in record.items()})
+        else:
+            self._file.write(json.dumps(record) + "\n")
+        if not record.get('error'):
+            self.done[record['filename']] = (record['size'], record['mtime_ns'])
+        self.count += 1
+    
+    @classmethod
+    def from_csv_row(cls, row):
+        """Turn a CSV row back into the record that was written"""
+        record = dict(row)
+        for field in cls.CSV_JSON_FIELDS:
+            record[field] = json.loads(record[field])
+        for field in ('size', 'mtime_ns', 'student_count'):
+            record[field] = int(record[field])
+        record['has_telephone'] = record['has_telephone'] == 'True'
+        record['error'] = record.get('error') or None
+        return record
+    
+    def is_done(self, filename, stamp):
+        """True if the file already has a record, was read without error and has not changed since"""
+        return self.done.get(filename) == tuple(stamp)
+    
+    def write(self, record):
+        """Append one document's record, flushing every flush_every records"""
+        self._write(record)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.file.flush()
+            self._unflushed = 0
+    
+    def close(self):
+        self.file.close()
+
 
 class SchoolDocumentAnalyzer:
     """Analyzes school documents for duplicates and inconsistencies"""
     
-    def __init__(self):
-        self.doc_pattern = re.compile(r"(\d{8})\s*[\w\W\d\s]+\.docx$")
+    # Scan cache record layout, changed whenever extract_document() returns new fields
+    cache_kind = "analysis-2"
+    
+    def __init__(self, use_cache=True, fuzzy_threshold=0.85):
+        # Keep extraction results in a cache file inside each analyzed directory
+        self.use_cache = use_cache
+        # Report names at least this similar as possible duplicates (None turns fuzzy matching off)
+        self.fuzzy_matcher = FuzzyNameMatcher(fuzzy_threshold) if fuzzy_threshold is not None else None
         self.name_pattern = re.compile(r"NAME:\s*([\w\s\W]+)")
         self.school_pattern = re.compile(r"SCHOOL:\s*(\d{8})\s*([\w\s\W]+)")
         self.tel_pattern = re.compile(r"TEL:\s*\d{10}\s*/\s*\d{10}\.")
+        self.name_separator_pattern = re.compile(r"[\W_]+")
+        # Normalized student name -> [(filename, school code, paragraph), ...] of the last scan
+        self.name_index = defaultdict(list)
     
     def find_document_files(self, directory_path):
         """Find all relevant DOCX files in the directory"""
         directory = Path(directory_path)
         return [f for f in directory.iterdir() 
-                if f.is_file() and f.suffix.lower() == '.docx' and self.doc_pattern.match(f.name)]
-    
-    def extract_student_names(self, doc_path):
-        """Extract all student names from a document"""
-        try:
-            doc = docx.Document(doc_path)
-            return [match.group(1).strip() for para in doc.paragraphs 
-                    if (match := self.name_pattern.match(para.text))]
-        except Exception as e:
-            print(f"Error reading {doc_path.name}: {e}")
-            return []
-    
-    def extract_school_codes(self, doc_path):
-        """Extract school codes from document content"""
-        try:
-            doc = docx.Document(doc_path)
-            codes = deque()
-            
-            for para in doc.paragraphs:
-                if match := self.school_pattern.match(para.text):
-                    codes.append(match.group(1))
-            
-            return codes
-        except Exception as e:
-            print(f"Error processing school codes in {doc_path.name}: {e}")
-            return deque()
-    
-    def check_telephone_presence(self, doc_path):
-        """Check if telephone pattern exists in document"""
-        try:
-            doc = docx.Document(doc_path)
-            for para in doc.paragraphs:
-                if self.tel_pattern.search(para.text):
-                    return True
-            print(f"Telephone number not found in: {doc_path.name}")
-            return False
-        except Exception as e:
-            print(f"Error checking telephone in {doc_path.name}: {e}")
-            return False
+                if parse_school_filename(f.name) and f.is_file()]
     
     def find_duplicates(self, items):
         """Find duplicate items in a list"""
@@ -72,31 +293,136 @@ class SchoolDocumentAnalyzer:
     
     def extract_file_school_code(self, filename):
         """Extract school code from filename"""
-        patterns = [
-            re.compile(r"(\d{8})\s*[A-Z\s\W]+\s*pg\s*\d\s*-\s*\d+"),
-            re.compile(r"(\d{8})\s*[A-Z\s\W]+\s*\d\s*-\s*\d+"),
-            re.compile(r"(\d{8})")
-        ]
-        
-        for pattern in patterns:
-            if match := pattern.match(filename):
-                return match.group(1)
-        return None
-    
-    def analyze_directory(self, directory_path):
-        """Analyze all documents in the directory"""
+        parsed = parse_school_filename(filename)
+        return parsed.code if parsed else None
+    
+    def open_cache(self, directory_path):
+        """Open the scan cache kept in the directory, or None if caching is off or not possible"""
+        if not self.use_cache:
+            return None
+        try:
+            return ScanCache(directory_path)
+        except sqlite3.Error as e:
+            print(f"Scan cache unavailable in {directory_path}: {e}")
+            return None
+    
+    def extract_document(self, doc_path):
+        """Read a document once and apply the name, school and telephone patterns in a
+        single walk over its paragraphs, returning one record:
+        {'names': [...], 'name_paragraphs': [...], 'school_codes': [...], 'has_telephone': bool}
+        where name_paragraphs holds the 1-based paragraph number of each name.
+        
+        Errors opening the document are raised to the caller."""
+        doc = docx.Document(doc_path)
+        names = []
+        name_paragraphs = []
+        school_codes = []
+        has_telephone = False
+        
+        for number, para in enumerate(doc.paragraphs, 1):
+            text = para.text
+            if match := self.name_pattern.match(text):
+                names.append(match.group(1).strip())
+                name_paragraphs.append(number)
+            elif match := self.school_pattern.match(text):
+                school_codes.append(match.group(1))
+            if not has_telephone and self.tel_pattern.search(text):
+                has_telephone = True
+        
+        return {'names': names, 'name_paragraphs': name_paragraphs,
+                'school_codes': school_codes, 'has_telephone': has_telephone}
+    
+    def extract_document_data(self, doc_path, cache=None):
+        """Return the extract_document() record of a document, from the scan cache when
+        the file has not changed since it was last read
+        
+        A document that cannot be read gets an empty record with its 'error' message."""
+        if cache:
+            stamp = cache.stamp(doc_path)
+            data = cache.get(doc_path, self.cache_kind, stamp)
+            if data is not None:
+                return data
+        
+        try:
+            data = self.extract_document(doc_path)
+        except Exception as e:
+            # Unreadable files are not cached so they are reported again next run
+            print(f"Error reading {doc_path.name}: {e}")
+            return {'names': [], 'name_paragraphs': [], 'school_codes': [], 'has_telephone': False,
+                    'error': str(e) or type(e).__name__}
+        
+        if cache:
+            cache.put(doc_path, self.cache_kind, data, stamp)
+        return data
+    
+    def normalize_name(self, name):
+        """Upper-case a name and reduce punctuation and runs of spaces to single spaces"""
+        return " ".join(self.name_separator_pattern.sub(" ", name).upper().split())
+    
+    def index_names(self, filename, school_code, data):
+        """Add the names of one extracted document to the global name index"""
+        for name, paragraph in zip(data['names'], data['name_paragraphs']):
+            if key := self.normalize_name(name):
+                self.name_index[key].append((filename, school_code, paragraph))
+    
+    def find_cross_duplicates(self):
+        """Find names of the last scan that appear in more than one file
+        
+        Returns (cross_file, cross_school): lists of (name, occurrences) for names found in
+        several files of the same school (e.g. pg 1-20 and pg 21-40) and for names found
+        under more than one school code."""
+        cross_file = []
+        cross_school = []
+        for name, occurrences in self.name_index.items():
+            if len(occurrences) < 2:
+                continue
+            if len({filename for filename, _, _ in occurrences}) < 2:
+                continue
+            if len({code for _, code, _ in occurrences}) > 1:
+                cross_school.append((name, occurrences))
+            else:
+                cross_file.append((name, occurrences))
+        
+        cross_file.sort()
+        cross_school.sort()
+        return cross_file, cross_school
+    
+    def find_fuzzy_duplicates(self):
+        """Find pairs of different names of the last scan that are probably the same pupil
+        
+        Returns [(similarity, name_a, name_b), ...]; empty when fuzzy matching is off."""
+        if not self.fuzzy_matcher:
+            return []
+        return self.fuzzy_matcher.match(self.name_index.keys())
+    
+    def analyze_directory(self, directory_path, sink=None):
+        """Analyze all documents in the directory
+        
+        With a ResultSink each record is also streamed to its file as soon as the document
+        is analyzed, and documents the sink already has an up to date record for are
+        skipped; the returned list then only holds the documents analyzed in this run."""
         doc_files = self.find_document_files(directory_path)
         analysis_results = []
+        cache = self.open_cache(directory_path)
+        self.name_index = defaultdict(list)
         
         for doc_file in doc_files:
+            stamp = ScanCache.stamp(doc_file)
+            if sink and sink.is_done(doc_file.name, stamp):
+                print(f"Already analyzed: {doc_file.name}")
+                continue
             print(f"Processing: {doc_file.name}")
             
             # Extract data
-            student_names = self.extract_student_names(doc_file)
+            data = self.extract_document_data(doc_file, cache)
+            student_names = data['names']
             student_duplicates = self.find_duplicates(student_names)
-            school_codes = self.extract_school_codes(doc_file)
+            school_codes = data['school_codes']
             file_school_code = self.extract_file_school_code(doc_file.name)
-            has_telephone = self.check_telephone_presence(doc_file)
+            has_telephone = data['has_telephone']
+            if not has_telephone and not data.get('error'):
+                print(f"Telephone number not found in: {doc_file.name}")
+            self.index_names(doc_file.name, file_school_code, data)
             
             # Check for school code mismatches
             code_mismatches = []
@@ -104,27 +430,47 @@ class SchoolDocumentAnalyzer:
                 if file_school_code and content_code != file_school_code:
                     code_mismatches.append(f"PG {i}: {file_school_code} -> {content_code}")
             
-            analysis_results.append({
+            result = {
                 'filename': doc_file.name,
+                'size': stamp[0],
+                'mtime_ns': stamp[1],
+                'school_code': file_school_code,
                 'student_count': len(student_names),
                 'student_duplicates': student_duplicates,
                 'code_mismatches': code_mismatches,
-                'has_telephone': has_telephone
-            })
+                'has_telephone': has_telephone,
+                'names': student_names,
+                'name_paragraphs': data['name_paragraphs'],
+                'error': data.get('error')
+            }
+            analysis_results.append(result)
+            if sink:
+                sink.write(result)
+        
+        if cache:
+            cache.evict_missing()
+            cache.close()
         
         return analysis_results
     
     def generate_report(self, directory_path, analysis_results):
-        """Generate analysis report file"""
+        """Generate analysis report file
+        
+        analysis_results can be any iterable of records, such as read_results() over a
+        ResultSink file; it is read once and the global name index is rebuilt from it."""
         report_path = directory_path / f"DUPLICATE ANALYSIS - {directory_path.name.upper()}.txt"
+        self.name_index = defaultdict(list)
         
         with open(report_path, 'w', encoding='utf-8') as report_file:
             report_file.write("SCHOOL DOCUMENT ANALYSIS REPORT\n")
             report_file.write("=" * 50 + "\n\n")
             
             for result in analysis_results:
+                self.index_names(result['filename'], result['school_code'], result)
                 report_file.write(f"File: {result['filename']}\n")
                 report_file.write("=" * (len(result['filename']) + 6) + "\n")
+                if result.get('error'):
+                    report_file.write(f"Could Not Be Read: {result['error']}\n")
                 report_file.write(f"Student Count: {result['student_count']}\n")
                 report_file.write(f"Student Duplicates: {len(result['student_duplicates'])}\n")
                 report_file.write(f"Telephone Present: {'Yes' if result['has_telephone'] else 'No'}\n")
@@ -142,6 +488,31 @@ class SchoolDocumentAnalyzer:
                         report_file.write(f"- {mismatch}\n")
                 
                 report_file.write("\n" + "=" * 50 + "\n\n")
+            
+            cross_file, cross_school = self.find_cross_duplicates()
+            for title, duplicates in [("Duplicates Across Files Of The Same School", cross_file),
+                                      ("Duplicates Across Schools", cross_school)]:
+                heading = f"{title}: {len(duplicates)}"
+                report_file.write(heading + "\n")
+                report_file.write("=" * len(heading) + "\n")
+                for name, occurrences in duplicates:
+                    report_file.write(f"- {name}\n")
+                    for filename, code, paragraph in sorted(occurrences):
+                        report_file.write(f"    {code} | {filename} | para {paragraph}\n")
+                report_file.write("\n")
+            
+            if self.fuzzy_matcher:
+                fuzzy_duplicates = self.find_fuzzy_duplicates()
+                heading = (f"Possible Duplicates (similarity >= {self.fuzzy_matcher.threshold}): "
+                           f"{len(fuzzy_duplicates)}")
+                report_file.write(heading + "\n")
+                report_file.write("=" * len(heading) + "\n")
+                for similarity, name_a, name_b in fuzzy_duplicates:
+                    report_file.write(f"- {name_a} ~ {name_b} ({similarity:.2f})\n")
+                    for name in (name_a, name_b):
+                        for filename, code, paragraph in sorted(self.name_index[name]):
+                            report_file.write(f"    {name} | {code} | {filename} | para {paragraph}\n")
+                report_file.write("\n")
         
         return report_path
 
@@ -161,14 +532,19 @@ def main():
                 print("Error: Directory does not exist or is not a valid directory!")
                 continue
             
+            # Results are streamed to a JSON Lines file first; an interrupted run picks up
+            # where it stopped and the text report is rendered from that file
+            results_path = directory / f"DUPLICATE ANALYSIS - {directory.name.upper()}.jsonl"
             print("\nAnalyzing documents...")
-            results = analyzer.analyze_directory(directory)
+            with ResultSink(results_path, directory) as sink:
+                analyzer.analyze_directory(directory, sink)
             
-            if not results:
+            if not sink.count:
                 print("No valid school documents found in the directory!")
                 continue
             
-            report_path = analyzer.generate_report(directory, results)
+            report_path = analyzer.generate_report(directory, read_results(results_path))
+            print(f"Results saved as: {results_path}")
             print(f"\nAnalysis complete! Report saved as: {report_path}")
             
             # Ask to continue
@@ -0,0 +1,45 @@
+'''
+Filename rules shared by schools_checklist_generator.py and multiple_schools_duplicate_searcher.py.
+A school document is named "<8 digit code> <anything>.docx"; the checklist only counts names of the form
+"<code> <SCHOOL NAME>[ pg 1-20][ 1-20].docx". Both forms are told apart by one pattern compiled at import,
+and the result for each filename is memoized, so large directory listings are classified in one quick pass.
+
+'''
+
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# One pattern for both forms: the first alternative is the checklist form and fills the
+# school (and pages) groups, the second accepts any other name after the code
+SCHOOL_FILE_PATTERN = re.compile(
+    r"(?P<code>\d{8})"
+    r"(?:\s+(?P<school>[A-Z\s\W]+?)"
+    r"(?:\s*pg\s*(?P<pages>\d\s*-\s*\d+))?"
+    r"(?:\s*\d\s*-\s*\d+)?"
+    r"|.+)"
+    r"\.docx$",
+    re.IGNORECASE
+)
+
+
+class SchoolFilename(NamedTuple):
+    """What a school document's filename says about it"""
+    code: str                # 8 digit school code
+    school: str | None       # School name, only for names in the checklist form
+    pages: str | None        # Page range after "pg", e.g. "1-20"
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_school_filename(filename: str) -> SchoolFilename | None:
+    """Parse a school document filename, or return None if it is not one"""
+    match = SCHOOL_FILE_PATTERN.match(filename)
+    if not match:
+        return None
+    school = match.group('school')
+    pages = match.group('pages')
+    return SchoolFilename(
+        match.group('code'),
+        school.strip() if school is not None else None,
+        "".join(pages.split()) if pages is not None else None
+    )
@@ -0,0 +1,85 @@
+'''
+A small on-disk cache shared by schools_checklist_generator.py and multiple_schools_duplicate_searcher.py.
+What each script reads out of a school .docx (pupil count, names, school codes, telephone presence) is
+stored in a SQLite file inside the scanned directory, keyed on the file's path, size and modification
+time, so files that have not changed since the last run are never parsed again.
+
+'''
+
+import os
+import json
+import sqlite3
+
+CACHE_FILENAME = ".school_scan_cache.sqlite"
+
+
+class ScanCache:
+    """SQLite cache of per-file extraction results for one directory of school documents
+
+    Entries are stored per (file, kind), where kind names the script's record layout
+    (e.g. "pupils" or "analysis"), and are only returned while the file's size and
+    mtime are the same as when the entry was written."""
+
+    def __init__(self, directory: str, filename: str = CACHE_FILENAME):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(self.directory, filename)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            " path TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (path, kind))"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key(self, file_path) -> str:
+        """Paths are stored relative to the directory so a moved folder keeps its cache"""
+        return os.path.relpath(os.path.abspath(file_path), self.directory)
+
+    @staticmethod
+    def stamp(file_path) -> tuple:
+        """Size and mtime of a file, taken before it is read"""
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path, kind: str, stamp: tuple | None = None) -> dict | None:
+        """Return the cached record for a file, or None if missing or the file has changed"""
+        size, mtime_ns = stamp or self.stamp(file_path)
+        row = self.connection.execute(
+            "SELECT data FROM scans WHERE path = ? AND kind = ? AND size = ? AND mtime_ns = ?",
+            (self._key(file_path), kind, size, mtime_ns)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, file_path, kind: str, data: dict, stamp: tuple | None = None) -> None:
+        """Store the record read from a file; pass the stamp taken before reading it"""
+        size, mtime_ns = stamp or self.stamp(file_path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO scans (path, kind, size, mtime_ns, data) VALUES (?, ?, ?, ?, ?)",
+            (self._key(file_path), kind, size, mtime_ns, json.dumps(data))
+        )
+
+    def evict_missing(self) -> int:
+        """Delete the entries of files that no longer exist and return how many were removed"""
+        paths = [path for (path,) in self.connection.execute("SELECT DISTINCT path FROM scans")]
+        missing = [(path,) for path in paths
+                   if not os.path.isfile(os.path.join(self.directory, path))]
+        self.connection.executemany("DELETE FROM scans WHERE path = ?", missing)
+        self.connection.commit()
+        return len(missing)
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
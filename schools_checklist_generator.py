@@ -8,76 +8,226 @@ across Kiambu and Nairobi counties.
 
 import os
 import re
+import copy
+import argparse
 import docx
 import pathlib
+import sqlite3
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from docx.oxml.ns import qn
 from docx.shared import Cm, Pt
 from typing import List, Tuple
+from school_filenames import parse_school_filename
+from school_scan_cache import ScanCache, CACHE_FILENAME
+
+# WordprocessingML tags used when streaming word/document.xml
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_R, W_HYPERLINK = W_NS + "p", W_NS + "r", W_NS + "hyperlink"
+# Run children and the text python-docx gives them in paragraph.text (None: the element's text)
+W_RUN_TEXT = {W_NS + "t": None, W_NS + "tab": "\t", W_NS + "br": "\n", W_NS + "cr": "\n",
+              W_NS + "noBreakHyphen": "-", W_NS + "ptab": "\t"}
+# Only line breaks (the default w:type) read as "\n", page and column breaks give no text
+W_BR, W_BR_TYPE = W_NS + "br", W_NS + "type"
 
 class SchoolChecklistGenerator:
     """A class to generate school checklists from Word documents"""
     
-    def __init__(self):
+    def __init__(self, workers: int | None = None, use_cache: bool = True):
+        # Number of processes used to scan school files (None uses every core, 1 scans in this process)
+        self.workers = workers
+        # Keep pupil counts in a cache file inside each scanned directory
+        self.use_cache = use_cache
         self.name_pattern = re.compile(r"NAME:\s*([\w\s\W]+)")
-        # Combined file pattern with named groups
-        self.file_pattern = re.compile(
-            r"(?P<code>\d{8})\s+"
-            r"(?P<school>[A-Z\s\W]+?)"
-            r"(?:\s*pg\s*\d\s*-\s*\d+)?"
-            r"(?:\s*\d\s*-\s*\d+)?"
-            r"\.docx$",
-            re.IGNORECASE
-        )
+    
+    def count_pupils(self, doc_path: str) -> int:
+        """Count the NAME: paragraphs in a Word document, raising if the file cannot be read
+        
+        Instead of building the whole python-docx object model, word/document.xml is read
+        straight out of the .docx zip with iterparse. Only the text of top level body
+        paragraphs is kept (the same paragraphs as doc.paragraphs) and every element is
+        dropped from the tree as soon as it has been read."""
+        with zipfile.ZipFile(doc_path) as package:
+            try:
+                document_xml = package.open("word/document.xml")
+            except KeyError:
+                # Main document stored under another name, let python-docx resolve it
+                doc = docx.Document(doc_path)
+                return sum(1 for paragraph in doc.paragraphs 
+                          if self.name_pattern.match(paragraph.text))
+            with document_xml:
+                return self._count_name_paragraphs(document_xml)
+    
+    def _count_name_paragraphs(self, document_xml) -> int:
+        """Stream a document.xml file object and count paragraphs matching name_pattern"""
+        count = 0
+        tags = []      # Tags of the elements currently open, from w:document down
+        body = None
+        text = None    # Text pieces of the body paragraph being read
+        for event, elem in ET.iterparse(document_xml, events=("start", "end")):
+            if event == "start":
+                tags.append(elem.tag)
+                if len(tags) == 2:
+                    body = elem
+                elif len(tags) == 3 and elem.tag == W_P:
+                    text = []
+                continue
+            
+            tags.pop()
+            depth = len(tags)
+            if text is not None and elem.tag in W_RUN_TEXT and tags[-1] == W_R and (
+                    depth == 4 or (depth == 5 and tags[3] == W_HYPERLINK)):
+                # Run content directly inside the paragraph or one of its hyperlinks
+                piece = W_RUN_TEXT[elem.tag]
+                if elem.tag == W_BR and elem.get(W_BR_TYPE, "textWrapping") != "textWrapping":
+                    piece = ""
+                text.append((elem.text or "") if piece is None else piece)
+            elif depth == 2:
+                # End of a top level body element
+                if text is not None:
+                    if self.name_pattern.match("".join(text)):
+                        count += 1
+                    text = None
+                body.clear()
+        return count
     
     def find_number_of_pupils(self, doc_path: str) -> int:
         """Count the number of pupils in a Word document by searching for NAME: pattern"""
         try:
-            doc = docx.Document(doc_path)
-            return sum(1 for paragraph in doc.paragraphs 
-                      if self.name_pattern.match(paragraph.text))
+            return self.count_pupils(doc_path)
         except Exception as e:
             print(f"Error reading file {doc_path}: {e}")
             return 0
     
     def process_school_file(self, file_path: str, filename: str) -> Tuple | None:
         """Process a single school file and return its data if valid"""
-        match = self.file_pattern.match(filename)
-        if match:
-            try:
-                code = int(match.group('code'))
-                school = match.group('school').strip()
-                pupil_count = self.find_number_of_pupils(file_path)
-                return (code, school, pupil_count, "", "", "")
-            except ValueError:
-                print(f"Invalid code format in file: {filename}")
-        return None
-    
-    def search_school_files(self, directory_path: str) -> Tuple[List, List]:
-        """Search through directory and process all school files"""
+        record, error = self.scan_school_file(file_path, filename)
+        if error:
+            print(error)
+        return record
+    
+    def scan_school_file(self, file_path: str, filename: str) -> Tuple[Tuple | None, str | None]:
+        """Process a single school file without printing, returning (record, error)
+        
+        A file that cannot be read still gives a record with 0 pupils, as before, so the
+        checklist keeps its row; the error is returned alongside it."""
+        parsed = parse_school_filename(filename)
+        if not parsed or parsed.school is None:
+            return None, None
+        code = int(parsed.code)
+        school = parsed.school
+        try:
+            pupil_count = self.count_pupils(file_path)
+            error = None
+        except Exception as e:
+            pupil_count = 0
+            error = f"Error reading file {file_path}: {e}"
+        return (code, school, pupil_count, "", "", ""), error
+    
+    def open_cache(self, directory_path: str) -> ScanCache | None:
+        """Open the scan cache kept in the directory, or None if caching is off or not possible"""
+        if not self.use_cache:
+            return None
+        try:
+            return ScanCache(directory_path)
+        except sqlite3.Error as e:
+            print(f"[!] Scan cache unavailable in {directory_path}: {e}")
+            return None
+    
+    def search_school_files(self, directory_path: str, workers: int | None = None,
+                            executor: ProcessPoolExecutor | None = None) -> Tuple[List, List, List]:
+        """Search through directory and process all school files
+        
+        Files are read in a process pool of `workers` processes (defaults to self.workers),
+        or in `executor` when a pool is shared between several directories;
+        files unchanged since the last scan take their pupil count from the scan cache.
+        Returns the valid records sorted by school code, the invalid filenames and a list
+        of (filename, error) for files that failed while being read."""
         valid_files = []
         invalid_files = []
+        failed_files = []
         
         try:
-            for filename in os.listdir(directory_path):
-                file_path = os.path.join(directory_path, filename)
-                
-                # Skip directories and non-Word files
-                if not os.path.isfile(file_path) or not filename.lower().endswith('.docx'):
-                    invalid_files.append(filename)
-                    continue
-                
-                # Process valid school files
-                file_data = self.process_school_file(file_path, filename)
-                if file_data:
-                    valid_files.append(file_data)
-                else:
-                    invalid_files.append(filename)
-                    
+            filenames = sorted(os.listdir(directory_path))
         except OSError as e:
             print(f"Error accessing directory {directory_path}: {e}")
+            return valid_files, invalid_files, failed_files
+        
+        cache = self.open_cache(directory_path)
+        
+        # Skip directories, non-Word files and names that are not school files, and use
+        # cached counts, before any work is handed to the pool
+        paths, names, stamps = [], [], []
+        for filename in filenames:
+            if filename.startswith(CACHE_FILENAME):
+                continue
+            file_path = os.path.join(directory_path, filename)
+            parsed = parse_school_filename(filename)
+            if not parsed or parsed.school is None or not os.path.isfile(file_path):
+                invalid_files.append(filename)
+                continue
+            if cache:
+                stamp = cache.stamp(file_path)
+                cached = cache.get(file_path, "pupils", stamp)
+                if cached is not None:
+                    valid_files.append((filename, (int(parsed.code), parsed.school,
+                                                   cached["pupils"], "", "", "")))
+                    continue
+                stamps.append(stamp)
+            paths.append(file_path)
+            names.append(filename)
+        
+        workers = workers if workers is not None else self.workers
+        if executor is None and (workers == 1 or len(paths) < 2):
+            results = list(map(self.scan_school_file, paths, names))
+        else:
+            workers = workers or os.cpu_count() or 1
+            chunksize = max(1, len(paths) // (workers * 4))
+            if executor is not None:
+                results = list(executor.map(self.scan_school_file, paths, names, chunksize=chunksize))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(self.scan_school_file, paths, names, chunksize=chunksize))
         
-        # Sort valid files by school code
-        valid_files.sort(key=lambda x: x[0])
-        return valid_files, invalid_files
+        for i, (record, error) in enumerate(results):
+            if record:
+                valid_files.append((names[i], record))
+            else:
+                invalid_files.append(names[i])
+            if error:
+                failed_files.append((names[i], error))
+            elif cache and record:
+                cache.put(paths[i], "pupils", {"pupils": record[2]}, stamps[i])
+        
+        if cache:
+            cache.evict_missing()
+            cache.close()
+        
+        # Sort valid files by school code (then filename, so cached and freshly read files mix evenly)
+        valid_files.sort(key=lambda x: (x[1][0], x[0]))
+        return [record for _, record in valid_files], invalid_files, failed_files
+    
+    @staticmethod
+    def add_table_rows(table, rows: List[List[str]]) -> None:
+        """Append rows of cell texts to a Word table in one pass
+        
+        table.add_row() walks the table XML on every call, which gets slow for checklists
+        with thousands of schools. Instead one row is built as a template and deep copied
+        for each record, only the text of its cells being set."""
+        template = table.add_row()
+        for cell in template.cells:
+            cell.text = "-"  # Gives every cell a single run with one w:t to fill in
+        tr = template._tr
+        tbl = tr.getparent()
+        tbl.remove(tr)
+        
+        for row in rows:
+            new_tr = copy.deepcopy(tr)
+            for t, text in zip(new_tr.iter(qn('w:t')), row):
+                t.text = text
+            tbl.append(new_tr)
     
     def write_to_word(self, output_path: str, records: List[Tuple], 
                      county: str, subcounty: str) -> None:
@@ -110,23 +260,149 @@ class SchoolChecklistGenerator:
             header_cells[i].paragraphs[0].runs[0].bold = True
         
         # Add data rows
+        rows = []
         for i, record in enumerate(records, 1):
             code, school, num, rec, check, sign = record
-            row_cells = table.add_row().cells
-            
-            row_cells[0].text = str(i)
-            row_cells[1].text = str(code)
-            row_cells[2].text = school
-            row_cells[3].text = str(num)
-            row_cells[4].text = check
-            row_cells[5].text = rec
-            row_cells[6].text = sign
+            rows.append([str(i), str(code), school, str(num), check, rec, sign])
+        self.add_table_rows(table, rows)
         
         # Save document
         output_filename = os.path.join(output_path, f"{county.upper()}_{subcounty.upper()}_CHECKLIST.docx")
         doc.save(output_filename)
         print(f"Checklist saved as: {output_filename}")
     
+    def write_summary(self, output_path: str, summary: dict) -> str:
+        """Generate the Word document summarising pupils and schools of every county and sub-county"""
+        doc = docx.Document()
+        
+        # Add title
+        doc.add_heading("SCHOOLS CHECKLIST SUMMARY", 0)
+        
+        grand_schools = grand_pupils = 0
+        for county in sorted(summary):
+            # Add county subtitle
+            paragraph = doc.add_paragraph()
+            subtitle = paragraph.add_run(f"{county.upper()} COUNTY")
+            subtitle.underline = True
+            subtitle.font.size = Pt(16)
+            
+            # Create table
+            table = doc.add_table(rows=1, cols=4)
+            table.style = "Table Grid"
+            
+            col_widths = [Cm(1.5), Cm(8.5), Cm(2.5), Cm(2.5)]
+            for i, width in enumerate(col_widths):
+                table.columns[i].width = width
+            
+            headers = ["NO.", "SUB-COUNTY", "SCHOOLS", "PUPILS"]
+            header_cells = table.rows[0].cells
+            for i, header in enumerate(headers):
+                header_cells[i].text = header
+                header_cells[i].paragraphs[0].runs[0].bold = True
+            
+            # Add one row per sub-county and a total row
+            total_schools = total_pupils = 0
+            for i, (subcounty, schools, pupils) in enumerate(sorted(summary[county]), 1):
+                row_cells = table.add_row().cells
+                row_cells[0].text = str(i)
+                row_cells[1].text = subcounty.upper()
+                row_cells[2].text = str(schools)
+                row_cells[3].text = str(pupils)
+                total_schools += schools
+                total_pupils += pupils
+            
+            row_cells = table.add_row().cells
+            for i, text in enumerate(["", "TOTAL", str(total_schools), str(total_pupils)]):
+                row_cells[i].text = text
+                if text:
+                    row_cells[i].paragraphs[0].runs[0].bold = True
+            
+            doc.add_paragraph()
+            grand_schools += total_schools
+            grand_pupils += total_pupils
+        
+        total = doc.add_paragraph().add_run(
+            f"ALL COUNTIES: {grand_schools} SCHOOLS, {grand_pupils} PUPILS")
+        total.bold = True
+        
+        # Save document
+        output_filename = os.path.join(output_path, "COUNTIES_CHECKLIST_SUMMARY.docx")
+        doc.save(output_filename)
+        print(f"Summary saved as: {output_filename}")
+        return output_filename
+    
+    def find_subcounty_folders(self, root_path: str) -> List[Tuple[str, str, str]]:
+        """Walk a County/SubCounty/*.docx tree once and return (county, subcounty, folder)
+        for every sub-county folder that holds Word documents"""
+        folders = []
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            dirnames.sort()
+            parts = pathlib.Path(os.path.relpath(dirpath, root_path)).parts
+            if len(parts) == 2:
+                # County and sub-county come from the path; nothing deeper is scanned
+                dirnames.clear()
+                if any(filename.lower().endswith('.docx') for filename in filenames):
+                    folders.append((parts[0], parts[1], dirpath))
+        return folders
+    
+    def _process_folder(self, county: str, subcounty: str, folder: str,
+                        executor: ProcessPoolExecutor) -> Tuple[List, List, List]:
+        """Scan one sub-county folder and write its checklist (used by run_batch)"""
+        records, invalid_files, failed_files = self.search_school_files(folder, executor=executor)
+        if records:
+            self.write_to_word(folder, records, county, subcounty)
+        return records, invalid_files, failed_files
+    
+    def run_batch(self, root_path: str) -> dict:
+        """Generate the checklist of every County/SubCounty folder under root_path without prompting
+        
+        Folders are processed concurrently by a thread pool sharing one process pool for
+        reading files. Each checklist is saved in its sub-county folder and one summary of
+        all counties in root_path. Returns {county: [(subcounty, schools, pupils), ...]}."""
+        print("SCHOOL CHECKLIST GENERATOR (BATCH)")
+        print("----------------------------------")
+        
+        folders = self.find_subcounty_folders(root_path)
+        if not folders:
+            print(f"[!] No County/SubCounty folders with .docx files found in {root_path}")
+            return {}
+        print(f"\n[+] Processing {len(folders)} sub-county folders...")
+        
+        summary = defaultdict(list)
+        problems = []
+        workers = self.workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor, \
+                ThreadPoolExecutor(max_workers=min(len(folders), workers)) as folder_pool:
+            futures = {
+                folder_pool.submit(self._process_folder, county, subcounty, folder, executor): (county, subcounty)
+                for county, subcounty, folder in folders
+            }
+            for future in as_completed(futures):
+                county, subcounty = futures[future]
+                try:
+                    records, invalid_files, failed_files = future.result()
+                except Exception as e:
+                    problems.append(f"{county}/{subcounty}: {e}")
+                    continue
+                
+                if not records:
+                    problems.append(f"{county}/{subcounty}: no valid school files")
+                    continue
+                summary[county].append((subcounty, len(records), sum(record[2] for record in records)))
+                for filename, error in failed_files:
+                    problems.append(f"{county}/{subcounty}/{filename}: {error}")
+        
+        if summary:
+            self.write_summary(root_path, summary)
+        
+        if problems:
+            print(f"\n[!] {len(problems)} problems found:")
+            for problem in problems:
+                print(f"    - {problem}")
+        
+        print(f"\n[+] Generated {sum(len(rows) for rows in summary.values())} of {len(folders)} checklists")
+        return dict(summary)
+    
     def run(self):
         """Main method to run the checklist generator"""
         print("SCHOOL CHECKLIST GENERATOR")
@@ -154,7 +430,7 @@ class SchoolChecklistGenerator:
                 
                 # Process files
                 print("\n[+] Processing files...")
-                records, invalid_files = self.search_school_files(str(directory_path))
+                records, invalid_files, failed_files = self.search_school_files(str(directory_path))
                 
                 # Show invalid files if any
                 if invalid_files:
@@ -164,6 +440,14 @@ class SchoolChecklistGenerator:
                     if len(invalid_files) > 5:
                         print(f"    - ... and {len(invalid_files) - 5} more")
                 
+                # Show files that matched but could not be read (counted with 0 pupils)
+                if failed_files:
+                    print(f"\n[!] {len(failed_files)} files could not be read (counted as 0 pupils):")
+                    for filename, error in failed_files[:5]:
+                        print(f"    - {filename}: {error}")
+                    if len(failed_files) > 5:
+                        print(f"    - ... and {len(failed_files) - 5} more")
+                
                 # Generate checklist
                 if records:
                     print(f"\n[+] Found {len(records)} valid school files")
@@ -187,5 +471,17 @@ class SchoolChecklistGenerator:
 
 # Run the application
 if __name__ == "__main__":
-    generator = SchoolChecklistGenerator()
-    generator.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate school checklists from Word documents")
+    parser.add_argument("--batch", metavar="ROOT",
+                        help="generate every checklist of a County/SubCounty/*.docx tree without prompting")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes used to read school files (default: all cores)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not read or write the scan cache in each folder")
+    args = parser.parse_args()
+    
+    generator = SchoolChecklistGenerator(workers=args.workers, use_cache=not args.no_cache)
+    if args.batch:
+        generator.run_batch(args.batch)
+    else:
+        generator.run()
\ No newline at end of file